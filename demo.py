@@ -7,6 +7,7 @@ simple_log(__file__)
 
 # Now bring in the instrument factory
 from instruments import factory
+from instruments.decimate import minmax
 
 ps = factory.power_supply
 
@@ -53,7 +54,7 @@ oscope.stop()
 
 v,t,preamble = oscope.data(channel = 1)
 print(f'LENGTH = {len(v)}')
-pl.plot(t,v)
+pl.plot(*minmax(t,v))    # Decimated for display, peaks are kept
 pl.xlabel('Time (s)')
 pl.ylabel('Voltage (V)')
 pl.show()
\ No newline at end of file
@@ -1,4 +1,3 @@
-import csv
 import time
 from matplotlib import pyplot as pl 
 
@@ -8,6 +7,8 @@ simple_log(__file__)
 
 # Now bring in the instrument factory
 from instruments import factory
+from instruments.decimate import minmax
+from instruments import wavexport
 
 try:
     ps = factory.power_supply
@@ -63,13 +64,15 @@ try:
 
     oscope.screen_capture('.\ethan_screen_capture.png')
 
-    with open('.\ethan_data.csv',mode = 'w',newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['t_output','v_output','v_inv_input','v_ninv_input','v_ref'])
-        for i in range(len(t_output)):
-            writer.writerow([t_output[i],v_output[i],v_inv_input[i],v_ninv_input[i],v_ref[i]])
+    # Written to the working directory as before (oscope.export would write under datastorage_path)
+    wavexport.export({ 'v_output'     : (v_output, t_output),
+                       'v_inv_input'  : (v_inv_input, t_inv_input),
+                       'v_ninv_input' : (v_ninv_input, t_ninv_input),
+                       'v_ref'        : (v_ref, t_ref)
+                     }, '.\\ethan_data.csv', format = 'csv', time_label = 't_output')
     
-    pl.plot(t_output,v_output, t_inv_input, v_inv_input, t_ninv_input, v_ninv_input, t_ref, v_ref)
+    # Decimated for display, peaks are kept
+    pl.plot(*minmax(t_output,v_output), *minmax(t_inv_input, v_inv_input), *minmax(t_ninv_input, v_ninv_input), *minmax(t_ref, v_ref))
     pl.title('Bi-stable Oscillator Performance')
     pl.xlabel('Time (s)')
     pl.ylabel('Voltage (V)')
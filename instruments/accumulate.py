@@ -0,0 +1,239 @@
+# Streaming accumulators for averaging and persistence across many acquisitions
+# Each capture is folded in as it arrives so memory is O(record) no matter how many
+# captures are taken
+#
+#   Average         running mean and variance per sample (Welford)
+#   Envelope        running minimum and maximum per sample
+#   Persistence     2-D (time x voltage) hit count histogram
+#
+# USAGE:  avg = Average()
+#         env = Envelope()
+#         scope.acquire_loop(1000, 1, sink(1, avg, env))
+#         mean, std = avg.mean, avg.std
+#
+#         fold(['run0', 'run1'], avg, directory = scope.datastorage_path)   # Stored captures (see wavestore)
+
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+from . import wavestore
+
+CHUNK_POINTS = 1 << 20  # Samples folded in at a time
+
+def _frames(v):
+    ''' Returns v as 2-D (one row per frame) so segmented captures fold in frame by frame
+    '''
+    v = np.asarray(v)
+    if v.ndim == 1:
+        return v.reshape(1, -1)
+    elif v.ndim == 2:
+        return v
+    raise ValueError('v must be 1-D or 2-D (one row per frame)')
+
+class Average:
+    ''' Running mean and variance of each sample over every capture added
+    '''
+    def __init__(self):
+        self._count = 0
+        self._mean = None
+        self._m2 = None     # Sum of squared differences from the mean
+
+    def add(self, v):
+        ''' Fold in one capture (1-D) or several frames (2-D, one row per frame)
+        '''
+        for row in _frames(v):
+            if self._mean is None:
+                self._mean = np.zeros(len(row))
+                self._m2 = np.zeros(len(row))
+            elif len(row) != len(self._mean):
+                raise ValueError(f'capture has {len(row)} points, expected {len(self._mean)}')
+
+            self._count += 1
+            for i in range(0, len(row), CHUNK_POINTS):
+                j = i + CHUNK_POINTS
+                x = np.asarray(row[i:j], dtype = np.float64)
+                delta = x - self._mean[i:j]
+                self._mean[i:j] += delta / self._count
+                self._m2[i:j] += delta * (x - self._mean[i:j])
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def variance(self):
+        ''' Sample variance (None until two captures are added)
+        '''
+        if self._count < 2:
+            return None
+        return self._m2 / (self._count - 1)
+
+    @property
+    def std(self):
+        variance = self.variance
+        return None if variance is None else np.sqrt(variance)
+
+class Envelope:
+    ''' Running minimum and maximum of each sample over every capture added
+    '''
+    def __init__(self):
+        self._count = 0
+        self._min = None
+        self._max = None
+
+    def add(self, v):
+        ''' Fold in one capture (1-D) or several frames (2-D, one row per frame)
+        '''
+        v = _frames(v)
+        if self._min is None:
+            self._min = np.full(v.shape[1], np.inf)
+            self._max = np.full(v.shape[1], -np.inf)
+        elif v.shape[1] != len(self._min):
+            raise ValueError(f'capture has {v.shape[1]} points, expected {len(self._min)}')
+
+        for i in range(0, v.shape[1], CHUNK_POINTS):
+            j = i + CHUNK_POINTS
+            np.minimum(self._min[i:j], v[:, i:j].min(axis = 0), out = self._min[i:j])
+            np.maximum(self._max[i:j], v[:, i:j].max(axis = 0), out = self._max[i:j])
+        self._count += v.shape[0]
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+class Persistence:
+    ''' Hit count histogram of voltage against sample position, like a scope's infinite persistence display
+
+    :vrange: (low, high) voltage span of the histogram, values outside are clipped to the edge rows
+    (NaN samples, e.g., the padding of short frames, are not counted)
+
+    :vbins: voltage rows
+
+    :columns: time columns, None for one per sample (records longer than columns are binned)
+
+    NOTE: the histogram is limited to MAX_CELLS (vbins x columns), with columns = None long records
+    get fewer columns and a warning
+    '''
+    MAX_CELLS = 1 << 24     # 128 MB of int64 counts
+
+    def __init__(self, vrange, vbins = 256, columns = 1000):
+        if not isinstance(vrange, (tuple, list)) or len(vrange) != 2 or vrange[1] <= vrange[0]:
+            raise ValueError('vrange must be (low, high) with high > low')
+
+        if not isinstance(vbins, int) or vbins < 1:
+            raise ValueError('vbins must be an integer > 0')
+
+        if columns is not None and (not isinstance(columns, int) or columns < 1):
+            raise ValueError('columns must be None or an integer > 0')
+
+        self._vrange = (float(vrange[0]), float(vrange[1]))
+        self._vbins = vbins
+        self._columns = columns
+        self._points = None
+        self._count = 0
+        self._hits = None
+
+    def add(self, v):
+        ''' Fold in one capture (1-D) or several frames (2-D, one row per frame)
+        '''
+        v = _frames(v)
+        if self._hits is None:
+            self._points = v.shape[1]
+            columns = self._points if self._columns is None else min(self._columns, self._points)
+            if self._vbins * columns > self.MAX_CELLS:
+                columns = max(1, self.MAX_CELLS // self._vbins)
+                print(f'[WARNING] Persistence of {self._points} points x {self._vbins} vbins limited to {columns} columns')
+            self._hits = np.zeros((self._vbins, columns), dtype = np.int64)
+        elif v.shape[1] != self._points:
+            raise ValueError(f'capture has {v.shape[1]} points, expected {self._points}')
+
+        vbins, columns = self._hits.shape
+        low, high = self._vrange
+        scale = vbins / (high - low)
+        for i in range(0, self._points, CHUNK_POINTS):
+            j = min(i + CHUNK_POINTS, self._points)
+
+            # Only the columns this chunk falls in are counted, so the bincount stays chunk sized
+            column = np.arange(i, j) * columns // self._points
+            first = column[0]
+            span = column[-1] - first + 1
+
+            x = np.asarray(v[:, i:j], dtype = np.float64)
+            finite = np.isfinite(x)
+            row = ((np.where(finite, x, low) - low) * scale).astype(np.int64)
+            np.clip(row, 0, vbins - 1, out = row)
+            index = (row * span + (column - first))[finite]
+            self._hits[:, first:first + span] += np.bincount(index, minlength = vbins * span).reshape(vbins, span)
+        self._count += v.shape[0]
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def hits(self):
+        ''' vbins x columns hit counts, row 0 is the low end of vrange
+        '''
+        return self._hits
+
+    @property
+    def extent(self):
+        ''' (left, right, bottom, top) in sample positions and volts, e.g., for imshow(hits, origin = 'lower', extent = extent)
+        '''
+        return (0, self._points, self._vrange[0], self._vrange[1])
+
+def sink(channel, *accumulators):
+    ''' Returns a callable for Oscilloscope.acquire_loop that folds channel into each accumulator
+
+    The last t and preamble seen are kept on the callable as .t and .preamble
+    '''
+    if len(accumulators) == 0:
+        raise ValueError('at least one accumulator is required')
+
+    def fold_capture(k, captures):
+        v, t, preamble = captures[channel]
+        for a in accumulators:
+            a.add(v)
+        fold_capture.t = t
+        fold_capture.preamble = preamble
+
+    fold_capture.t = None
+    fold_capture.preamble = None
+
+    return fold_capture
+
+def fold(captures, *accumulators, directory = None):
+    ''' Fold stored captures into each accumulator
+
+    :captures: iterable of wavestore names or waveform arrays
+
+    :directory: where the names are (see wavestore.load), e.g., the scope's datastorage_path
+
+    :return: the number of captures folded
+    '''
+    if len(accumulators) == 0:
+        raise ValueError('at least one accumulator is required')
+
+    n = 0
+    for c in captures:
+        v = wavestore.load(c, directory = directory)[0] if isinstance(c, str) else c
+        for a in accumulators:
+            a.add(v)
+        n += 1
+
+    return n
@@ -26,9 +26,37 @@ modedict = {None : None,
            "PER"     : MultiMeter.Mode.PERIOD
            }
 
+configdict = {  MultiMeter.Mode.DC_VOLT     : "CONFigure:VOLTage:DC",
+                MultiMeter.Mode.AC_VOLT     : "CONFigure:VOLTage:AC",
+                MultiMeter.Mode.DC_AMP      : "CONFigure:CURRent:DC",
+                MultiMeter.Mode.AC_AMP      : "CONFigure:CURRent:AC",
+                MultiMeter.Mode.RESISTANCE  : "CONFigure:RESistance",
+                MultiMeter.Mode.FREQUENCY   : "CONFigure:FREquency",
+                MultiMeter.Mode.PERIOD      : "CONFigure:PERiod"
+             }
+
+def _decode_config(response):
+    ''' (mode, range) from a CONFigure? response
+    '''
+    vals = response.split(' ')
+    ret_mode = modedict[vals[0].replace('"','')]
+
+    ret_range = vals[1].split(',')[0]
+    try:
+        ret_range = float(ret_range)
+    except ValueError:
+        # A nonnumeric string like "AUTO", "MIN", "MAX", or "DEFAULT" was returned
+        pass
+
+    return ret_mode, ret_range
+
 class AT344XXA(MultiMeter):
     USB_PID = '0000'
 
+    # See Device.apply(), the value is (mode, range) as in set_mode_range
+    SETTINGS = {    'mode_range'    : ('CONFigure?', '{value}', _decode_config, lambda v: f'{configdict[v[0]]} {v[1]};:TRIGger:SOURce IMMediate')
+               }
+
     def __init__(self,*args, **kwargs):
         super(AT344XXA, self).__init__(*args, **kwargs)
 
@@ -90,18 +118,7 @@ class AT344XXA(MultiMeter):
     def get_mode_range(self):
         # This device returns mode, range, and resolution in a single response that needs to be parsed
         # Resolution is usually fixed by this device model so is generally ignored even on command option
-        str = self.query('CONFigure?')
-        vals = str.split(' ')
-        ret_mode = modedict[vals[0].replace('"','')]
-
-        ret_range = vals[1].split(',')[0]
-        try:
-            ret_range = float(ret_range)
-        except ValueError:
-            # A nonnumeric string like "AUTO", "MIN", "MAX", or "DEFAULT" was returned
-            pass
-
-        return ret_mode, ret_range
+        return _decode_config(self.query('CONFigure?'))
 
     def read(self):
         return self.query_float('READ?')
@@ -0,0 +1,112 @@
+# Peak-preserving (min/max) decimation for plotting large records
+# Each bucket of consecutive samples is reduced to its minimum and maximum, kept in time order,
+# so N samples become about 2 x pixels points and a single sample glitch is never lost
+#
+# For step plots of on-change data (one row per transition, drawn with where='post') pass
+# keep_last = True so the last row of each bucket, which holds until the next bucket, is kept too
+#
+# Works chunk-wise so memory-mapped (see wavestore) or streamed waveforms are never fully loaded
+
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+
+CHUNK_POINTS = 1 << 20  # Samples reduced at a time
+
+class MinMax:
+    ''' Streaming min/max decimator
+
+    :keep_last: also keep the last sample of each bucket (3 points per bucket)
+
+    USAGE:  mm = MinMax(bucket = 1000)
+            for t, v in chunks:
+                mm.add(t, v)
+            t, v = mm.result()
+    '''
+    def __init__(self, bucket, keep_last = False):
+        if not isinstance(bucket, int) or bucket < 1:
+            raise ValueError('bucket must be an integer > 0')
+
+        self._bucket = bucket
+        self._keep_last = keep_last
+        self._t = []
+        self._v = []
+        self._carry_t = None    # Partial bucket carried to the next add()
+        self._carry_v = None
+
+    @property
+    def bucket(self):
+        return self._bucket
+
+    def add(self, t, v):
+        ''' Reduce the next chunk of samples, t and v must be the same length
+        '''
+        t = np.asarray(t)
+        v = np.asarray(v)
+        if len(t) != len(v):
+            raise ValueError(f't length {len(t)} does not match v length {len(v)}')
+
+        if self._carry_t is not None:
+            t = np.concatenate((self._carry_t, t))
+            v = np.concatenate((self._carry_v, v))
+
+        m = len(v) // self._bucket
+        n = m * self._bucket
+        if m > 0:
+            self._reduce(t[:n], v[:n].reshape(m, self._bucket))
+
+        self._carry_t = t[n:].copy()
+        self._carry_v = v[n:].copy()
+
+    def _reduce(self, t, blocks):
+        imin = blocks.argmin(axis = 1)
+        imax = blocks.argmax(axis = 1)
+        if self._keep_last:
+            index = np.sort(np.column_stack((imin, imax, np.full(len(blocks), blocks.shape[1] - 1))), axis = 1)
+        else:
+            index = np.column_stack((np.minimum(imin, imax), np.maximum(imin, imax)))
+        index += (np.arange(len(blocks)) * blocks.shape[1])[:, None]
+        index = index.ravel()
+
+        self._t.append(t[index])
+        self._v.append(blocks.ravel()[index])
+
+    def result(self):
+        ''' Returns the decimated t, v including any partial bucket still held
+        '''
+        if self._carry_t is not None and len(self._carry_t):
+            self._reduce(self._carry_t, self._carry_v.reshape(1, -1))
+            self._carry_t = None
+            self._carry_v = None
+
+        if len(self._t) == 0:
+            return np.array([]), np.array([])
+
+        return np.concatenate(self._t), np.concatenate(self._v)
+
+def minmax(t, v, pixels = 2000, keep_last = False):
+    ''' Decimate t, v to about 2 x pixels points keeping the min and max of each bucket
+    (and its last sample with keep_last, for step plots of on-change data)
+
+    Records already small enough are returned as is
+    '''
+    if len(t) != len(v):
+        raise ValueError(f't length {len(t)} does not match v length {len(v)}')
+
+    if not isinstance(pixels, int) or pixels < 1:
+        raise ValueError('pixels must be an integer > 0')
+
+    if len(v) <= 2 * pixels:
+        return np.asarray(t), np.asarray(v)
+
+    bucket = int(np.ceil(len(v) / pixels))
+    chunk = max(1, CHUNK_POINTS // bucket) * bucket
+
+    mm = MinMax(bucket, keep_last)
+    for i in range(0, len(v), chunk):
+        mm.add(t[i:i + chunk], v[i:i + chunk])
+
+    return mm.result()
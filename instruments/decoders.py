@@ -0,0 +1,173 @@
+# Host-side protocol decoders (UART, SPI, I2C) for logic analyzer captures
+# Decode straight from the LogicCapture returned by Logic.data instead of running the Logic
+# GUI analyzers and exporting their results
+#
+# Lines are sampled at arbitrary times by binary search over the capture's row times, so both
+# on-change (one row per transition) and each-sample captures work, and the bits of every
+# frame are gathered with array operations. Results are numpy record arrays, one record per word.
+
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+
+UART_DTYPE = np.dtype([('time', 'f8'), ('data', 'u2'), ('parity_error', '?'), ('framing_error', '?')])
+SPI_DTYPE = np.dtype([('time', 'f8'), ('mosi', 'u8'), ('miso', 'u8')])
+I2C_DTYPE = np.dtype([('time', 'f8'), ('data', 'u1'), ('ack', '?'), ('address', '?')])
+
+def _sample(capture, channel, times):
+    ''' Value of channel at each of times (the row in effect at that time)
+    '''
+    i = np.searchsorted(capture.t, times, side='right') - 1
+    return capture[channel][np.maximum(i, 0)]
+
+def _pack(bits, msb_first):
+    ''' Words from rows of bits
+    '''
+    n = bits.shape[1]
+    shifts = np.arange(n - 1, -1, -1) if msb_first else np.arange(n)
+    return np.sum(bits.astype(np.uint64) << shifts.astype(np.uint64), axis=1)
+
+def uart(capture, channel, baud, bits = 8, parity = None, stop_bits = 1, inverted = False):
+    ''' Decode asynchronous serial data (LSB first)
+
+    :parity: None, 'even', or 'odd'
+
+    :inverted: True when the line idles low
+
+    :return: record array of time (start bit), data, parity_error, framing_error (stop bit not idle)
+    '''
+    if parity not in (None, 'even', 'odd'):
+        raise ValueError("parity must be None, 'even', or 'odd'")
+
+    ix = capture.index(channel)
+    starts = ix.edges(edge='rising' if inverted else 'falling')
+    bit_sec = 1.0 / baud
+    frame_sec = (1 + bits + (parity is not None) + stop_bits) * bit_sec
+
+    # A start edge inside a frame is data, so frames are found one at a time but only
+    # by jumping between candidate edges
+    frames = []
+    i = 0
+    while i < len(starts):
+        frames.append(starts[i])
+        i = np.searchsorted(starts, starts[i] + frame_sec - 0.5 * bit_sec, side='left')
+
+    frames = np.array(frames)
+    if len(frames) == 0:
+        return np.zeros(0, dtype=UART_DTYPE)
+
+    # Sample every bit of every frame at its center
+    n = 1 + bits + (parity is not None) + stop_bits
+    times = frames[:, None] + (np.arange(n) + 0.5) * bit_sec
+    levels = _sample(capture, channel, times.ravel()).reshape(times.shape)
+    if inverted:
+        levels = ~levels
+
+    data = levels[:, 1:1 + bits]
+    result = np.zeros(len(frames), dtype=UART_DTYPE)
+    result['time'] = frames
+    result['data'] = _pack(data, msb_first = False)
+
+    if parity is not None:
+        ones = np.sum(data, axis=1) + levels[:, 1 + bits]
+        result['parity_error'] = (ones % 2) != (0 if 'even' == parity else 1)
+
+    result['framing_error'] = levels[:, 0] | ~np.all(levels[:, n - stop_bits:], axis=1)
+
+    return result
+
+def spi(capture, clk, mosi = None, miso = None, cs = None, cpol = 0, cpha = 0, bits = 8, msb_first = True):
+    ''' Decode SPI words
+
+    :cs: chip select channel (active low), None to treat the whole capture as one transfer
+
+    :cpol, cpha: SPI mode, data is sampled on the rising clock edge when cpol == cpha
+
+    :return: record array of time (first clock edge of the word), mosi, miso
+    '''
+    if mosi is None and miso is None:
+        raise ValueError('at least one of mosi or miso is required')
+
+    edges = capture.index(clk).edges(edge='rising' if cpol == cpha else 'falling')
+
+    # Transfer (chip select assertion) of each edge, edges while deselected are ignored
+    if cs is None:
+        transfer = np.zeros(len(edges), dtype=np.int64)
+    else:
+        selected = ~_sample(capture, cs, edges)
+        edges = edges[selected]
+        transfer = np.searchsorted(capture.index(cs).edges(edge='falling'), edges, side='right')
+
+    if len(edges) == 0:
+        return np.zeros(0, dtype=SPI_DTYPE)
+
+    # Position of each edge within its transfer
+    first = np.flatnonzero(np.r_[True, transfer[1:] != transfer[:-1]])
+    position = np.arange(len(edges)) - np.repeat(first, np.diff(np.r_[first, len(edges)]))
+
+    # Keep complete words only
+    word = position // bits
+    key = transfer * (len(edges) + 1) + word
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    keep = counts[inverse] == bits
+
+    edges = edges[keep]
+    result = np.zeros(len(edges) // bits, dtype=SPI_DTYPE)
+    result['time'] = edges[::bits]
+    for name, channel in (('mosi', mosi), ('miso', miso)):
+        if channel is not None:
+            result[name] = _pack(_sample(capture, channel, edges).reshape(-1, bits), msb_first)
+
+    return result
+
+def i2c(capture, scl, sda):
+    ''' Decode I2C bytes
+
+    :return: record array of time (first clock edge of the byte), data, ack (9th bit low),
+    and address (True for the first byte after a START or repeated START)
+    '''
+    sda_ix = capture.index(sda)
+    sda_fall = sda_ix.edges(edge='falling')
+    sda_rise = sda_ix.edges(edge='rising')
+
+    # START is SDA falling and STOP is SDA rising while SCL is high
+    starts = sda_fall[_sample(capture, scl, sda_fall)]
+    stops = sda_rise[_sample(capture, scl, sda_rise)]
+
+    clocks = capture.index(scl).edges(edge='rising')
+    if len(starts) == 0 or len(clocks) == 0:
+        return np.zeros(0, dtype=I2C_DTYPE)
+
+    # Clocks belong to the latest START before them unless a STOP came after that START
+    transfer = np.searchsorted(starts, clocks, side='right') - 1
+    last_stop = np.searchsorted(stops, clocks, side='right') - 1
+    active = transfer >= 0
+    active[active] &= (last_stop[active] < 0) | (stops[np.maximum(last_stop[active], 0)] < starts[transfer[active]])
+
+    clocks = clocks[active]
+    transfer = transfer[active]
+    if len(clocks) == 0:
+        return np.zeros(0, dtype=I2C_DTYPE)
+
+    first = np.flatnonzero(np.r_[True, transfer[1:] != transfer[:-1]])
+    position = np.arange(len(clocks)) - np.repeat(first, np.diff(np.r_[first, len(clocks)]))
+
+    # 8 data bits and the acknowledge per byte, complete bytes only
+    byte = position // 9
+    key = transfer * (len(clocks) + 1) + byte
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    keep = counts[inverse] == 9
+
+    clocks = clocks[keep]
+    levels = _sample(capture, sda, clocks).reshape(-1, 9)
+
+    result = np.zeros(len(levels), dtype=I2C_DTYPE)
+    result['time'] = clocks[::9]
+    result['data'] = _pack(levels[:, :8], msb_first = True)
+    result['ack'] = ~levels[:, 8]
+    result['address'] = byte[keep][::9] == 0
+
+    return result
@@ -0,0 +1,187 @@
+# Eye diagram and jitter analysis of serial data captures (e.g., the v,t output of data())
+#
+# The clock is recovered from the threshold crossings (optionally with a hysteresis band so
+# noise around the threshold does not add crossings): crossing intervals are rounded to a
+# whole number of unit intervals (UI) and a straight line fit of crossing position against
+# UI number gives the ideal (constant frequency) clock. Time interval error (TIE) is the
+# distance of each crossing from that ideal clock.
+#
+# The record is then folded modulo 2 UI into a time x voltage histogram spanning -0.5 to 1.5 UI
+# (crossings at 0 and 1, eye center at 0.5). Everything is done in chunks so records of tens of
+# millions of samples (memory-mapped or not) are never copied to float64 all at once.
+
+# Standard
+from math import nan
+
+# 3rd party
+import numpy as np
+
+# Local
+from .measurements import crossings
+
+CHUNK_POINTS = 1 << 20  # Samples processed at a time
+
+def find_crossings(v, level, hysteresis = 0.0):
+    ''' Fractional sample positions where v crosses level, processed in chunks
+
+    :hysteresis: width of a band centered on level (Schmitt trigger). A crossing only counts once v
+    goes from one side of the band to the other and its position is the last level crossing before
+    v leaves the band, so noise near the threshold does not add crossings
+    '''
+    if hysteresis < 0.0:
+        raise ValueError('hysteresis must be >= 0')
+
+    upper = level + hysteresis / 2.0
+    lower = level - hysteresis / 2.0
+
+    positions = []
+    state = None    # Side of the band last seen (True above), carried between chunks
+    last = nan      # Last level crossing, carried between chunks
+    for i in range(0, len(v) - 1, CHUNK_POINTS):
+        x = np.asarray(v[i:i + CHUNK_POINTS + 1], dtype = np.float64)   # Overlap one sample with the next chunk
+        position, _ = crossings(x, level)
+        position += i
+        if hysteresis == 0.0:
+            positions.append(position)
+            continue
+
+        # Samples outside the band, the overlap sample belongs to the next chunk
+        n = len(x) if i + len(x) >= len(v) else len(x) - 1
+        marks = np.flatnonzero((x[:n] >= upper) | (x[:n] <= lower))
+        if len(marks):
+            high = x[marks] >= upper
+            previous = np.concatenate(([high[0] if state is None else state], high[:-1]))
+            change = marks[high != previous] + i
+
+            # The last level crossing before each change of side
+            candidates = np.concatenate(([last], position))
+            positions.append(candidates[np.searchsorted(position, change, side = 'left')])
+            state = bool(high[-1])
+
+        if len(position):
+            last = position[-1]
+
+    if len(positions) == 0:
+        return np.array([])
+
+    return np.concatenate(positions)
+
+def recover_clock(positions, ui = None):
+    ''' Fit an ideal clock to crossing positions (in samples)
+
+    :ui: nominal unit interval in samples, None to estimate it from the shortest crossing intervals
+
+    :return: ui, phase (position of UI number 0), and the UI number of each crossing
+    '''
+    if len(positions) < 3:
+        raise ValueError('at least 3 crossings are needed to recover a clock')
+
+    d = np.diff(positions)
+    if ui is None:
+        short = d[d < 1.5 * np.percentile(d, 5)]
+        ui = float(np.median(short))
+
+    n = np.maximum(np.rint(d / ui), 1)
+    k = np.concatenate(([0.0], np.cumsum(n)))
+
+    # Least squares line position = phase + k * ui
+    km = np.mean(k)
+    pm = np.mean(positions)
+    ui = float(np.sum((k - km) * (positions - pm)) / np.sum((k - km) ** 2))
+    phase = float(pm - ui * km)
+
+    return ui, phase, k
+
+def eye(v, t, bit_rate = None, level = None, vrange = None, xbins = 200, vbins = 256, center_ui = 0.1, jitter_bins = 100, hysteresis = 0.0):
+    ''' Build the eye diagram and jitter statistics of a serial data record
+
+    :bit_rate: nominal bits/sec, None to estimate it from the record
+
+    :level: decision threshold, None for the middle of the record's min and max
+
+    :hysteresis: width of a band centered on level that an edge must cross to count (see find_crossings),
+    use a few times the noise rms on noisy records
+
+    :vrange: (low, high) voltage span of the histogram, None for the record's span
+
+    :xbins, vbins: histogram columns (over 2 UI) and rows
+
+    :center_ui: width of the window around the eye center used for the eye height
+
+    :jitter_bins: bins in the TIE histogram
+
+    :return: dictionary with
+        ui_sec, bit_rate, level
+        tie_sec (per crossing), tie_rms_sec, tie_pp_sec, jitter_hist (counts, edges in sec)
+        hist (vbins x xbins hit counts, row 0 at vrange low) and extent (UI, V) for imshow
+        eye_height (mean - 3 sigma of the ones minus mean + 3 sigma of the zeros at the center)
+        eye_width_sec (UI less the peak to peak TIE)
+    '''
+    if len(v) != len(t):
+        raise ValueError(f'v length {len(v)} does not match t length {len(t)}')
+
+    if len(v) < 2:
+        raise ValueError('v must have at least 2 points')
+
+    xincr = float(t[1] - t[0])
+
+    if level is None or vrange is None:
+        vmin = min(float(np.min(v[i:i + CHUNK_POINTS])) for i in range(0, len(v), CHUNK_POINTS))
+        vmax = max(float(np.max(v[i:i + CHUNK_POINTS])) for i in range(0, len(v), CHUNK_POINTS))
+        if level is None:
+            level = (vmin + vmax) / 2.0
+        if vrange is None:
+            pad = 0.05 * (vmax - vmin)
+            vrange = (vmin - pad, vmax + pad)
+
+    if vrange[1] <= vrange[0]:
+        raise ValueError('vrange must be (low, high) with high > low')
+
+    positions = find_crossings(v, level, hysteresis)
+    nominal = None if bit_rate is None else 1.0 / (bit_rate * xincr)
+    ui, phase, k = recover_clock(positions, nominal)
+
+    tie = (positions - (phase + k * ui)) * xincr
+    counts, edges = np.histogram(tie, bins = jitter_bins)
+
+    # Fold the record into the 2 UI histogram and collect the center statistics
+    hist = np.zeros((vbins, xbins), dtype = np.int64)
+    low, high = vrange
+    scale = vbins / (high - low)
+    sums = np.zeros((2, 3))     # (zeros, ones) x (count, sum, sum of squares)
+    for i in range(0, len(v), CHUNK_POINTS):
+        x = np.asarray(v[i:i + CHUNK_POINTS], dtype = np.float64)
+        u = ((np.arange(i, i + len(x)) - phase) / ui + 0.5) % 2.0 - 0.5
+
+        column = ((u + 0.5) * (xbins / 2.0)).astype(np.int64)
+        np.clip(column, 0, xbins - 1, out = column)
+        row = ((x - low) * scale).astype(np.int64)
+        np.clip(row, 0, vbins - 1, out = row)
+        hist += np.bincount(row * xbins + column, minlength = vbins * xbins).reshape(vbins, xbins)
+
+        center = x[np.abs(u - 0.5) <= center_ui / 2.0]
+        for j, c in enumerate((center[center < level], center[center >= level])):
+            sums[j] += (len(c), np.sum(c), np.sum(c * c))
+
+    if np.all(sums[:, 0] > 0):
+        mean = sums[:, 1] / sums[:, 0]
+        sigma = np.sqrt(np.maximum(sums[:, 2] / sums[:, 0] - mean ** 2, 0.0))
+        height = float((mean[1] - 3.0 * sigma[1]) - (mean[0] + 3.0 * sigma[0]))
+    else:
+        height = nan
+
+    ui_sec = ui * xincr
+    tie_pp = float(np.ptp(tie))
+
+    return {    'ui_sec'        : ui_sec,
+                'bit_rate'      : 1.0 / ui_sec,
+                'level'         : level,
+                'tie_sec'       : tie,
+                'tie_rms_sec'   : float(np.std(tie)),
+                'tie_pp_sec'    : tie_pp,
+                'jitter_hist'   : (counts, edges),
+                'hist'          : hist,
+                'extent'        : (-0.5, 1.5, low, high),
+                'eye_height'    : height,
+                'eye_width_sec' : ui_sec - tie_pp
+           }
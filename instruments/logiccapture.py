@@ -0,0 +1,257 @@
+# Packed logic analyzer capture
+# Keeps the native data word stream (bit n is channel n, one word per transition or sample)
+# with its timestamps instead of one bool array per channel, so a 16 channel capture needs
+# 2 bytes per row rather than 16. Channel arrays are derived only when asked for.
+#
+# A LogicCapture also behaves like the list of per-channel bool arrays that Logic.data used
+# to return: len(capture), capture[channel], slicing (a list of channels), and iteration all work.
+#
+# TransitionIndex keeps the sorted edge times of one channel (see LogicCapture.index) so
+# repeated timing questions are answered by binary search over the edges
+
+# Standard
+from math import nan
+
+# 3rd party
+import numpy as np
+
+# Local
+
+def _word_type(num_channels):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if num_channels <= 8 * np.dtype(dtype).itemsize:
+            return dtype
+    raise ValueError('num_channels must be 64 or less')
+
+class LogicCapture:
+    ''' Timestamps plus packed data words of a logic capture
+
+    :t: time of each word
+
+    :words: data words, bit n is channel n
+
+    :num_channels: number of channels packed in each word
+    '''
+    def __init__(self, t, words, num_channels):
+        if len(t) != len(words):
+            raise ValueError(f't length {len(t)} does not match words length {len(words)}')
+
+        dtype = _word_type(num_channels)
+        words = np.asarray(words)
+        if words.dtype != dtype and not (words.dtype.kind == 'u' and words.dtype.itemsize <= np.dtype(dtype).itemsize):
+            words = words.astype(dtype)
+
+        self._t = t
+        self._words = words
+        self._num_channels = num_channels
+        self._index = {}    # TransitionIndex by channel, see index()
+
+    @property
+    def t(self):
+        return self._t
+
+    @property
+    def words(self):
+        return self._words
+
+    @property
+    def num_channels(self):
+        return self._num_channels
+
+    @property
+    def nbytes(self):
+        return self._words.nbytes + np.asarray(self._t).nbytes
+
+    def _check_channel(self, channel):
+        if not isinstance(channel, (int, np.integer)):
+            raise TypeError('channel must an integer type')
+
+        if channel < 0:
+            channel += self._num_channels
+
+        if channel not in range(self._num_channels):
+            raise IndexError(f'channel {channel} out of range: must be 0 through {self._num_channels - 1}')
+
+        return int(channel)
+
+    def channel(self, channel):
+        ''' bool array of one channel
+        '''
+        channel = self._check_channel(channel)
+        return ((self._words >> channel) & 1).astype(bool)
+
+    def bits(self):
+        ''' rows x num_channels bool array of every channel at once
+        '''
+        words = np.ascontiguousarray(self._words)
+        bits = np.unpackbits(words.view(np.uint8).reshape(len(words), -1), axis=1, bitorder='little')
+        return bits[:, :self._num_channels].astype(bool)
+
+    # List-like access to the channels
+    def __len__(self):
+        return self._num_channels
+
+    def __getitem__(self, channel):
+        if isinstance(channel, slice):
+            return [self.channel(ch) for ch in range(*channel.indices(len(self)))]
+        return self.channel(channel)
+
+    def __iter__(self):
+        for channel in range(self._num_channels):
+            yield self.channel(channel)
+
+    def find(self, channel, value):
+        ''' Returns the indices where channel is value (0 or 1)
+        '''
+        if value != 0 and value != 1:
+            raise ValueError('value must be 0 or 1')
+
+        channel = self._check_channel(channel)
+        return np.flatnonzero(((self._words >> channel) & 1) == value)
+
+    def find_transitions(self, channel = None):
+        ''' Returns the indices of every transition of channel (None for any channel)
+
+        NOTE: like Logic.find_transitions the index is that of the first word with the new value
+        '''
+        changed = self._words[1:] ^ self._words[:-1]
+        if channel is not None:
+            changed = (changed >> self._check_channel(channel)) & 1
+
+        return np.flatnonzero(changed) + 1
+
+    def is_bounced(self, channel):
+        ''' Returns True if channel has more than 2 transitions
+        '''
+        return len(self.find_transitions(channel)) > 2
+
+    def index(self, channel):
+        ''' TransitionIndex of channel, built on first use and kept for later queries
+        '''
+        channel = self._check_channel(channel)
+        if channel not in self._index:
+            self._index[channel] = TransitionIndex(self._t, self.channel(channel))
+
+        return self._index[channel]
+
+def _statistics(x):
+    if len(x) == 0:
+        return {'mean' : nan, 'std' : nan, 'min' : nan, 'max' : nan, 'count' : 0}
+
+    return {'mean' : float(np.mean(x)), 'std' : float(np.std(x)), 'min' : float(np.min(x)), 'max' : float(np.max(x)), 'count' : len(x)}
+
+class TransitionIndex:
+    ''' Sorted edge times of one channel for timing queries that only touch the edges involved
+    (binary search) rather than rescanning the capture
+
+    :t: time of each row of the capture
+
+    :channel_data: the channel value of each row (e.g., data[channel] from Logic.data)
+
+    USAGE:  ix = data.index(SOME_CHANNEL)
+            ix.edges(1.0e-3, 2.0e-3, 'rising')
+            ix.next_edge(t0)
+            ix.pulse_widths(1)
+            ix.period()['mean'], ix.duty()['mean']
+    '''
+    EDGES = ('rising', 'falling', 'both')
+
+    def __init__(self, t, channel_data):
+        if len(t) != len(channel_data):
+            raise ValueError(f't length {len(t)} does not match channel_data length {len(channel_data)}')
+
+        channel_data = np.asarray(channel_data).astype(bool)
+        index = np.flatnonzero(channel_data[1:] != channel_data[:-1]) + 1
+        rising = channel_data[index]
+
+        times = np.asarray(t)[index]
+        self._both = times
+        self._rising = times[rising]
+        self._falling = times[~rising]
+        self._initial = bool(channel_data[0]) if len(channel_data) else False
+
+    def _times(self, edge):
+        if 'rising' == edge:
+            return self._rising
+        elif 'falling' == edge:
+            return self._falling
+        elif 'both' == edge:
+            return self._both
+        raise ValueError(f'edge must be one of {self.EDGES}')
+
+    @staticmethod
+    def _window(times, start, stop):
+        i = 0 if start is None else np.searchsorted(times, start, side='left')
+        j = len(times) if stop is None else np.searchsorted(times, stop, side='right')
+        return times[i:j]
+
+    def __len__(self):
+        return len(self._both)
+
+    def edges(self, start = None, stop = None, edge = 'both'):
+        ''' Times of the edges with start <= time <= stop (None for unbounded)
+        '''
+        return self._window(self._times(edge), start, stop)
+
+    def count(self, start = None, stop = None, edge = 'both'):
+        ''' Number of edges with start <= time <= stop
+        '''
+        return len(self.edges(start, stop, edge))
+
+    def next_edge(self, t0, edge = 'both'):
+        ''' Time of the first edge after t0, None if there is none
+        '''
+        times = self._times(edge)
+        i = np.searchsorted(times, t0, side='right')
+        return float(times[i]) if i < len(times) else None
+
+    def level(self, t0):
+        ''' Channel value at time t0
+        '''
+        n = np.searchsorted(self._both, t0, side='right')
+        return self._initial ^ bool(n % 2)
+
+    def pulse_widths(self, level = 1, start = None, stop = None):
+        ''' Durations of the complete pulses at level (0 or 1) that lie within start..stop
+        '''
+        if level != 0 and level != 1:
+            raise ValueError('level must be 0 or 1')
+
+        times = self.edges(start, stop)
+        if len(times) < 2:
+            return np.array([])
+
+        # The first edge in the window enters level when the channel was not at level before it
+        first = 0 if self.level(times[0]) == bool(level) else 1
+        begin = times[first::2]
+        end = times[first + 1::2]
+        n = min(len(begin), len(end))
+
+        return end[:n] - begin[:n]
+
+    def period(self, edge = 'rising', start = None, stop = None):
+        ''' Statistics (mean, std, min, max, count) of the time between like edges
+        '''
+        if 'both' == edge:
+            raise ValueError('period needs rising or falling edges')
+
+        return _statistics(np.diff(self.edges(start, stop, edge)))
+
+    def duty(self, start = None, stop = None):
+        ''' Statistics (mean, std, min, max, count) of the high time percentage of each complete cycle
+        (rising edge to rising edge)
+        '''
+        rising = self.edges(start, stop, 'rising')
+        if len(rising) < 2 or len(self._falling) == 0:
+            return _statistics(np.array([]))
+
+        # The falling edge inside each cycle
+        j = np.searchsorted(self._falling, rising[:-1], side='right')
+        ok = j < len(self._falling)
+        fall = self._falling[np.minimum(j, len(self._falling) - 1)]
+        ok &= fall < rising[1:]
+
+        high = (fall - rising[:-1])[ok]
+        cycle = np.diff(rising)[ok]
+
+        return _statistics(100.0 * high / cycle)
@@ -0,0 +1,137 @@
+# Mask and limit testing of waveforms (e.g., the v,t output of data() or the 2-D frame stack of segmented_data())
+# Masks are in scaled units (seconds, volts) and are evaluated once on the time axis, then every
+# sample of every frame is compared at once
+#
+#   upper/lower     piecewise-linear limit lines as (t, v) points, samples outside the
+#                   time span of a line are not tested against it
+#   polygons        keep-out regions as (t, v) vertices, any sample inside is a violation
+#
+# USAGE:  m = Mask(upper = [(0, 1.1), (1e-3, 1.1)], lower = [(0, -0.1), (1e-3, -0.1)],
+#                  polygons = [[(2e-4, 0.4), (3e-4, 0.4), (3e-4, 0.6), (2e-4, 0.6)]])
+#         r = m.test(v, t)
+#         if r['failed'].any(): ...
+
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+
+class Mask:
+    ''' Upper/lower limit lines and keep-out polygons
+    '''
+    UPPER = 0
+    LOWER = 1
+    POLYGON = 2     # Region of polygon i is POLYGON + i
+
+    def __init__(self, upper = None, lower = None, polygons = ()):
+        self._upper = self._points(upper, 'upper', 2)
+        self._lower = self._points(lower, 'lower', 2)
+        self._polygons = [self._points(p, 'polygon', 3) for p in polygons]
+
+        if self._upper is None and self._lower is None and len(self._polygons) == 0:
+            raise ValueError('mask needs at least one of upper, lower, or polygons')
+
+        self._t = None      # Time axis the limits were last evaluated on
+        self._limits = None
+
+    @staticmethod
+    def _points(points, name, minimum):
+        if points is None:
+            return None
+
+        points = np.asarray(points, dtype = np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < minimum:
+            raise ValueError(f'{name} must be a list of at least {minimum} (t, v) points')
+
+        if name != 'polygon' and np.any(np.diff(points[:, 0]) < 0):
+            raise ValueError(f'{name} points must be in increasing time order')
+
+        return points
+
+    def _evaluate(self, t):
+        ''' Interpolate the limit lines on t, cached while the same time axis is tested
+        '''
+        if self._t is not None and len(self._t) == len(t) and np.array_equal(self._t, t):
+            return self._limits
+
+        upper = None
+        if self._upper is not None:
+            upper = np.interp(t, self._upper[:, 0], self._upper[:, 1], left = np.inf, right = np.inf)
+
+        lower = None
+        if self._lower is not None:
+            lower = np.interp(t, self._lower[:, 0], self._lower[:, 1], left = -np.inf, right = -np.inf)
+
+        # Columns each polygon can touch (its time span)
+        spans = [np.flatnonzero((t >= p[:, 0].min()) & (t <= p[:, 0].max())) for p in self._polygons]
+
+        self._t = np.array(t)
+        self._limits = (upper, lower, spans)
+
+        return self._limits
+
+    @staticmethod
+    def _inside(polygon, t, v):
+        ''' Even-odd rule point in polygon, t is 1-D (columns) and v is 2-D (frames x columns)
+        '''
+        inside = np.zeros(v.shape, dtype = bool)
+        t0, v0 = polygon[-1]
+        for t1, v1 in polygon:
+            if v1 != v0:
+                # Time where the edge crosses each v, compared to the sample time
+                tc = t0 + (v - v0) * ((t1 - t0) / (v1 - v0))
+                inside ^= ((v1 > v) != (v0 > v)) & (t < tc)
+            t0, v0 = t1, v1
+
+        return inside
+
+    def test(self, v, t):
+        ''' Test one waveform (1-D) or a frame stack (2-D, one row per frame) against the mask
+
+        :return: dictionary with
+            violations  count of failing samples in each frame
+            failed      bool for each frame
+            frame       frame of each failing sample
+            index       sample index of each failing sample
+            region      UPPER, LOWER, or POLYGON + i for each failing sample
+        '''
+        v = np.asarray(v)
+        t = np.asarray(t)
+        frames = v.reshape(1, -1) if v.ndim == 1 else v
+
+        if frames.ndim != 2 or frames.shape[1] != len(t):
+            raise ValueError(f'v has {frames.shape[-1]} points per frame but t has {len(t)}')
+
+        upper, lower, spans = self._evaluate(t)
+
+        frame = []
+        index = []
+        region = []
+        def record(mask, r, columns = None):
+            f, i = np.nonzero(mask)
+            frame.append(f)
+            index.append(i if columns is None else columns[i])
+            region.append(np.full(len(f), r, dtype = np.int32))
+
+        if upper is not None:
+            record(frames > upper, self.UPPER)
+        if lower is not None:
+            record(frames < lower, self.LOWER)
+        for n, (polygon, columns) in enumerate(zip(self._polygons, spans)):
+            if len(columns):
+                record(self._inside(polygon, t[columns], frames[:, columns]), self.POLYGON + n, columns)
+
+        frame = np.concatenate(frame) if frame else np.array([], dtype = np.intp)
+        index = np.concatenate(index) if index else np.array([], dtype = np.intp)
+        region = np.concatenate(region) if region else np.array([], dtype = np.int32)
+
+        violations = np.bincount(frame, minlength = len(frames))
+
+        return {    'violations'    : violations,
+                    'failed'        : violations > 0,
+                    'frame'         : frame,
+                    'index'         : index,
+                    'region'        : region
+               }
@@ -0,0 +1,203 @@
+# Host-side waveform measurements
+# Computes the Oscilloscope.Measurements from a waveform that was already transferred
+# (e.g., the v,t output of data()) so the full set costs a single transfer and the same
+# measurements can be repeated over stored data
+#
+# Definitions follow the usual scope conventions:
+#   TOP/BASE are the histogram modes of the upper/lower half of the waveform
+#   UPPER/MIDDLE/LOWER are the thresholds (10/50/90 % by default) between BASE and TOP
+#   Edges are qualified with LOWER/UPPER hysteresis so noise at MIDDLE is not counted
+#   Timing measurements are averaged over every complete edge/pulse in the record
+
+# Standard
+from math import nan
+
+# 3rd party
+import numpy as np
+
+# Local
+from .oscope import Oscilloscope
+
+M = Oscilloscope.Measurements
+
+def crossings(v, level):
+    ''' Returns the fractional sample positions where v crosses level and a bool array
+    that is True where the crossing is rising
+    '''
+    v = np.asarray(v, dtype=np.float64)    # Integer codes would wrap when differenced
+    above = v >= level
+    index = np.flatnonzero(above[1:] != above[:-1])
+    rising = above[index + 1]
+    position = index + (level - v[index]) / (v[index + 1] - v[index])
+
+    return position, rising
+
+def _crossing(v, index, level):
+    ''' Fractional position of level between samples index and index + 1
+    '''
+    return index + (level - v[index]) / (v[index + 1] - v[index])
+
+def _histogram_mode(v, default):
+    if len(v) == 0:
+        return default
+
+    counts, bins = np.histogram(v, bins = 256)
+    i = np.argmax(counts)
+    return (bins[i] + bins[i + 1]) / 2.0
+
+def _edges(v, lower, middle, upper):
+    ''' Find edges that travel all the way between lower and upper
+
+    Returns positions of (lower, middle, upper) crossings for rising and falling edges
+    '''
+    empty = (np.array([]), np.array([]), np.array([]))
+
+    state = np.zeros(len(v), dtype=np.int8)
+    state[v <= lower] = -1
+    state[v >= upper] = 1
+    nz = np.flatnonzero(state)
+    if len(nz) < 2:
+        return empty, empty
+
+    s = state[nz]
+    change = np.flatnonzero(s[1:] != s[:-1])
+    start = nz[change]          # last sample beyond the threshold being left
+    stop = nz[change + 1]       # first sample beyond the threshold being entered
+    rising = s[change + 1] > 0
+
+    position, _ = crossings(v, middle)
+
+    # The middle crossing of each edge is the first one after the edge leaves its threshold
+    mid = position[np.minimum(np.searchsorted(position, start), len(position) - 1)]
+
+    r_start, r_stop, r_mid = start[rising], stop[rising], mid[rising]
+    f_start, f_stop, f_mid = start[~rising], stop[~rising], mid[~rising]
+
+    rise = (_crossing(v, r_start, lower), r_mid, _crossing(v, r_stop - 1, upper))
+    fall = (_crossing(v, f_stop - 1, lower), f_mid, _crossing(v, f_start, upper))
+
+    return rise, fall
+
+def _mean(x):
+    return float(np.mean(x)) if len(x) else nan
+
+def _measure(v, t, thresholds):
+    ''' Compute every measurement for a single 1-D waveform
+    '''
+    dt = (t[-1] - t[0]) / (len(t) - 1) if len(t) > 1 else nan
+
+    vmax = float(np.max(v))
+    vmin = float(np.min(v))
+    half = (vmax + vmin) / 2.0
+    top = _histogram_mode(v[v >= half], vmax)
+    base = _histogram_mode(v[v < half], vmin)
+    amplitude = top - base
+
+    lower, middle, upper = (base + amplitude * p / 100.0 for p in thresholds)
+
+    r = {   M.V_MAX         : vmax,
+            M.V_MIN         : vmin,
+            M.V_PEAK2PEAK   : vmax - vmin,
+            M.V_TOP         : top,
+            M.V_UPPER       : upper,
+            M.V_MIDDLE      : middle,
+            M.V_LOWER       : lower,
+            M.V_BASE        : base,
+            M.V_AMPLITUDE   : amplitude,
+            M.V_AVG         : float(np.mean(v)),
+            M.V_RMS         : float(np.sqrt(np.mean(np.square(v, dtype=np.float64)))),
+            M.VARIANCE      : float(np.var(v)),
+            M.TIME_V_MAX    : float(t[np.argmax(v)]),
+            M.TIME_V_MIN    : float(t[np.argmin(v)]),
+            M.OVERSHOOT     : (vmax - top) / amplitude * 100.0 if amplitude > 0 else nan,
+            M.PRESHOOT      : (base - vmin) / amplitude * 100.0 if amplitude > 0 else nan,
+            M.AREA          : float(np.sum(v, dtype=np.float64) - (v[0] + v[-1]) / 2.0) * dt
+        }
+
+    (r_lo, r_mid, r_hi), (f_lo, f_mid, f_hi) = _edges(v, lower, middle, upper)
+
+    rise = _mean(r_hi - r_lo) * dt
+    fall = _mean(f_lo - f_hi) * dt
+
+    # Period from whichever edge type gives more complete cycles
+    edges = r_mid if len(r_mid) >= len(f_mid) else f_mid
+    period = _mean(np.diff(edges)) * dt
+
+    # Pulse widths pair each edge with the next edge of the opposite type
+    i = np.searchsorted(f_mid, r_mid)
+    ok = i < len(f_mid)
+    pwidth = _mean(f_mid[i[ok]] - r_mid[ok]) * dt
+
+    i = np.searchsorted(r_mid, f_mid)
+    ok = i < len(r_mid)
+    nwidth = _mean(r_mid[i[ok]] - f_mid[ok]) * dt
+
+    if len(edges) > 1:
+        a, b = int(np.ceil(edges[0])), int(np.floor(edges[1]))
+        period_area = float(np.sum(v[a:b + 1], dtype=np.float64)) * dt
+    else:
+        period_area = nan
+
+    r.update({  M.PERIOD_AREA       : period_area,
+                M.PERIOD            : period,
+                M.FREQUENCY         : 1.0 / period if period > 0 else nan,
+                M.RISE_TIME         : rise,
+                M.FALL_TIME         : fall,
+                M.POSITIVE_WIDTH    : pwidth,
+                M.NEGATIVE_WIDTH    : nwidth,
+                M.POSITIVE_DUTY     : pwidth / period * 100.0 if period > 0 else nan,
+                M.NEGATIVE_DUTY     : nwidth / period * 100.0 if period > 0 else nan,
+                M.POSITIVE_SLEW     : (upper - lower) / rise if rise > 0 else nan,
+                M.NEGATIVE_SLEW     : (lower - upper) / fall if fall > 0 else nan
+             })
+
+    return r
+
+def measure(v, t, measuretype = None, thresholds = (10, 50, 90)):
+    ''' Compute Oscilloscope.Measurements from waveform data on the host
+
+    :v: waveform values, 1-D or 2-D (one row per frame, e.g., segmented_data output)
+
+    :t: time of each sample (uniformly spaced, same for every frame)
+
+    :measuretype: either None (all), a value from Oscilloscope.Measurements, or tuple or list of values
+
+    :thresholds: lower, middle, upper thresholds in percent of amplitude
+
+    :return: a dictionary of measured values in lists (one value per frame) like Oscilloscope.measure
+    '''
+    if measuretype is None:
+        measuretype = list(M)
+    elif isinstance(measuretype, M):
+        measuretype = [measuretype]
+    elif isinstance(measuretype, (tuple, list)):
+        for m in measuretype:
+            if not isinstance(m, M):
+                raise ValueError('measuretype must contain values in Measurements enum')
+    else:
+        raise TypeError('measuretype must be a value or tuple of Measurements enum')
+
+    if not isinstance(thresholds, (tuple, list)) or len(thresholds) != 3:
+        raise TypeError('thresholds must be a tuple or list of 3 percentages')
+
+    # Integer coded waveforms (e.g., BYTE transfers) are measured as float so differences cannot wrap
+    v = np.asarray(v, dtype=np.float64)
+    t = np.asarray(t)
+    frames = v.reshape(1, -1) if v.ndim == 1 else v
+
+    if frames.shape[1] != len(t):
+        raise ValueError(f'v has {frames.shape[1]} points per frame but t has {len(t)}')
+
+    result = {}
+    for m in measuretype:
+        result.update({m : []})
+
+    for row in frames:
+        if len(row) == 0:
+            r = {}
+        else:
+            r = _measure(row, t, thresholds)
+        for m in measuretype:
+            result[m].append(float(r.get(m, nan)))
+
+    return result
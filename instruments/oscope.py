@@ -1,11 +1,16 @@
 # Standard imports
+from concurrent.futures import Future
 from enum import Enum
+import os
+import queue
+import threading
 import time
 
 # 3rd party imports
 
 # local imports
 from .scpi import Device
+from . import wavexport
 
 # Base class for all oscopes to help guide a common API
 # Each brand will be different in syntax but the core functionality will be the same
@@ -15,6 +20,10 @@ class Oscilloscope(Device):
     NUM_SIG_CHAN = 0
     MAX_DATA_POINTS = 0
 
+    # Trigger status polling starts fast and backs off to the max interval while waiting
+    TRIGGER_POLL_MIN_SEC = 0.001
+    TRIGGER_POLL_MAX_SEC = 0.050
+
     def __init__(self,*args, **kwargs):
         super(Oscilloscope, self).__init__(*args, **kwargs)
 
@@ -67,7 +76,22 @@ class Oscilloscope(Device):
     def trigger_status(self):
         raise NotImplementedError
 
-    def wait_for_trigger_status(self, trigger_status, timeout_sec):
+    class TriggerFuture(Future):
+        """ Future returned by arm() that resolves to the TriggerStatus that ended the wait
+        (or the last status seen at timeout)
+
+        Use asyncio.wrap_future() to await it from a coroutine
+
+        :polls: number of trigger_status() queries made so far
+
+        :latency_sec: time from arm() until the wait ended (None while waiting)
+        """
+        def __init__(self):
+            super().__init__()
+            self.polls = 0
+            self.latency_sec = None
+
+    def _check_trigger_status_args(self, trigger_status, timeout_sec):
         if not isinstance(trigger_status, Oscilloscope.TriggerStatus):
             if not isinstance(trigger_status, (list, tuple)):
                 raise TypeError("trigger_status must be an Oscilloscope.TriggerStatus or list or tuple of same")
@@ -81,19 +105,42 @@ class Oscilloscope(Device):
         if not isinstance(timeout_sec, (float, int)):
             raise TypeError("timeout_sec must be numeric")
 
+        return trigger_status
+
+    def _poll_trigger_status(self, trigger_status, timeout_sec, future):
+        """ Poll trigger_status() at an interval that grows from TRIGGER_POLL_MIN_SEC to
+        TRIGGER_POLL_MAX_SEC until one of trigger_status is seen or timeout
+        """
         verbose = self.verbose
         self.verbose = False
 
-        done = False
-        start  = time.perf_counter()
-        while (time.perf_counter() - start < timeout_sec) and not done:
-            for t in trigger_status:
-                if self.trigger_status() is t:
-                    done = True
+        try:
+            interval = self.TRIGGER_POLL_MIN_SEC
+            start = time.perf_counter()
+            while True:
+                stat = self.trigger_status()
+                future.polls += 1
+
+                elapsed = time.perf_counter() - start
+                if stat in trigger_status or elapsed >= timeout_sec:
                     break
 
-        self.verbose = verbose
-        return self.trigger_status()
+                time.sleep(min(interval, timeout_sec - elapsed))
+                interval = min(interval * 1.5, self.TRIGGER_POLL_MAX_SEC)
+
+            future.latency_sec = time.perf_counter() - start
+            future.set_result(stat)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self.verbose = verbose
+
+        return future
+
+    def wait_for_trigger_status(self, trigger_status, timeout_sec):
+        trigger_status = self._check_trigger_status_args(trigger_status, timeout_sec)
+
+        return self._poll_trigger_status(trigger_status, timeout_sec, Oscilloscope.TriggerFuture()).result()
 
     def trigger_holdoff(self, time_sec = None):
         ''' seconds between re-arming the trigger
@@ -162,6 +209,22 @@ class Oscilloscope(Device):
     def stop(self):
         raise NotImplementedError
 
+    def arm(self, trigsweep = TriggerSweeps.SINGLE, trigger_status = (TriggerStatus.TRIGGERED, TriggerStatus.STOPPED), timeout_sec = 10.0):
+        """ Start an acquisition with run(trigsweep) and return immediately with a TriggerFuture
+        that resolves when one of trigger_status is seen (or at timeout)
+
+        Other instruments can be set up while the scope waits, but this scope must not be
+        used until the future is done since the trigger status is polled from another thread
+        """
+        trigger_status = self._check_trigger_status_args(trigger_status, timeout_sec)
+
+        self.run(trigsweep)
+
+        future = Oscilloscope.TriggerFuture()
+        threading.Thread(target = self._poll_trigger_status, args = (trigger_status, timeout_sec, future), daemon = True).start()
+
+        return future
+
     class Measurements(Enum):
         V_MAX           =  0
         V_MIN           =  1
@@ -231,6 +294,44 @@ class Oscilloscope(Device):
         """
         raise NotImplementedError
 
+    def configure_measurements(self, channel, measuretype = None, statistics = False):
+        """Program persistent on-scope measurements of a single channel so that repeated
+        monitoring only needs read_measurements() instead of reprogramming each measurement
+
+        :channel: single integer channel
+
+        :measuretype: either None (all supported), a value from Measurements(Enum), or tuple or list of values
+
+        :statistics: True to also accumulate statistics on the instrument (see read_measurements)
+        """
+        raise NotImplementedError
+
+    def read_measurements(self):
+        """Read every measurement configured by configure_measurements in as few transactions as possible
+
+        :return: a dictionary of measured values in lists, like measure(), or when statistics
+        are enabled a dictionary of dictionaries with keys 'value', 'mean', 'stddev', 'min', 'max', 'population'
+        """
+        raise NotImplementedError
+
+    def host_measure(self, channel, measuretype = None, thresholds = (10, 50, 90), **kwargs):
+        """Single source measurements as defined by Measurements(Enum) computed on the host
+
+        The waveform is transferred once with data() and every measurement is computed from it,
+        instead of asking the scope for each measurement in turn (see measurements.measure)
+
+        :thresholds: lower, middle, upper thresholds in percent of amplitude
+
+        :kwargs: passed to data() (e.g., startstop, encoding)
+
+        :return: a dictionary of measured values in lists
+        """
+        # Local import since measurements refers back to this class
+        from .measurements import measure
+
+        v, t, _ = self.data(channel, **kwargs)
+        return measure(v, t, measuretype = measuretype, thresholds = thresholds)
+
     class DataEncoding(Enum):
         """ Common formats
         """
@@ -244,7 +345,14 @@ class Oscilloscope(Device):
         FLOAT32_BE  = 7
         FLOAT32_LE  = 8
 
-    def data(self, channel, startstop = (1, 10000), encoding = DataEncoding.ASCII):
+    def data(self, channel, startstop = (1, 10000), encoding = DataEncoding.ASCII, filename = None):
+        """ Transfer waveform data from the scope
+
+        :filename: (Optional) stream the transfer into a memory-mapped store at datastorage_path
+        so records larger than memory can be captured (see wavestore), in which case v and t are np.memmap
+
+        :return: v, t, preamble
+        """
         # Select a data source
         # Select encoding (e.g., ascii or binary various forms, etc)
         # Select number of bytes per data point (if applicable)
@@ -254,6 +362,213 @@ class Oscilloscope(Device):
 
         raise NotImplementedError
 
+    def raw_data(self, channel, **kwargs):
+        """ Transfer waveform data from the scope without decoding or scaling it, so that work
+        can be done elsewhere (e.g., off the acquisition thread, see acquire_loop)
+
+        :kwargs: as data() (e.g., startstop, encoding) without filename
+
+        :return: raw transfer for decode_data (the output of data() unless the derived class can split the two)
+        """
+        return self.data(channel, **kwargs)
+
+    def decode_data(self, raw):
+        """ Decode and scale a transfer from raw_data, only uses the transfer itself so it may run on any thread
+
+        :return: v, t, preamble as returned by data()
+        """
+        return raw
+
+    def segmented_acquisition(self, frames = None):
+        """ Configure segmented acquisition (e.g., FastFrame, waveform record) where each trigger
+        captures a frame into instrument memory so many triggers can be retrieved in one transfer
+
+        :frames: number of frames to capture on the next run(), 0 to disable, None to query
+
+        :return: the number of frames configured (0 when disabled) when frames is None
+        """
+        raise NotImplementedError
+
+    def segmented_data(self, channel, frames = None, encoding = DataEncoding.ASCII):
+        """ Transfer the frames captured by segmented_acquisition
+
+        :frames: number of frames to transfer, None for all acquired frames
+
+        :return: v, t, timestamps, preamble
+        where v is a 2-D array (frames x points), t is the time of each point in a frame,
+        and timestamps is the time of each frame's trigger relative to the first frame
+        """
+        raise NotImplementedError
+
+    def acquire_loop(self, n, channels, sink, queue_depth = 2, trigsweep = TriggerSweeps.SINGLE, timeout_sec = 10.0, **kwargs):
+        """ Repeat n captures of channels, handing each to sink on a worker thread so the
+        decoding, scaling, and processing/saving of capture k overlaps the re-arm and transfer
+        of capture k+1 (only the raw transfer, see raw_data, is done on the acquisition thread)
+
+        Captures whose trigger wait times out are not transferred or handed to sink, they are
+        only counted in timeouts (so sink may see fewer than n captures and gaps in k)
+
+        :channels: single integer channel or list or tuple of channels (or "MATH")
+
+        :sink: callable as sink(k, captures) where captures is a dictionary of
+        channel : (v, t, preamble) as returned by data()
+
+        :queue_depth: captures allowed to wait for the sink; acquisition blocks when the
+        sink falls this far behind (back-pressure)
+
+        :kwargs: passed to raw_data() (e.g., startstop, encoding)
+
+        :return: dictionary of statistics: captures (handed to sink), timeouts, elapsed_sec, captures_per_sec, and
+        blocked_sec (time acquisition waited on the sink)
+        """
+        if not isinstance(n, int) or n < 1:
+            raise ValueError('n must be an integer > 0')
+
+        if not isinstance(channels, (tuple, list)):
+            channels = [channels]
+
+        if not callable(sink):
+            raise TypeError('sink must be callable as sink(k, captures)')
+
+        if not isinstance(queue_depth, int) or queue_depth < 1:
+            raise ValueError('queue_depth must be an integer > 0')
+
+        pending = queue.Queue(maxsize = queue_depth)
+        errors = []
+
+        def worker():
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                if not errors:  # After a failure just drain so acquisition cannot block
+                    k, raw = item
+                    try:
+                        captures = {}
+                        for ch in raw:
+                            captures[ch] = self.decode_data(raw[ch])
+                        sink(k, captures)
+                    except Exception as e:
+                        errors.append(e)
+
+        thread = threading.Thread(target = worker, daemon = True)
+        thread.start()
+
+        stats = {'captures' : 0, 'timeouts' : 0, 'elapsed_sec' : 0.0, 'captures_per_sec' : 0.0, 'blocked_sec' : 0.0}
+        start = time.perf_counter()
+        try:
+            for k in range(n):
+                if errors:
+                    break
+
+                self.run(trigsweep)
+                stat = self.wait_for_trigger_status([self.TriggerStatus.TRIGGERED, self.TriggerStatus.STOPPED], timeout_sec)
+                self.stop()
+                if stat not in (self.TriggerStatus.TRIGGERED, self.TriggerStatus.STOPPED):
+                    # Memory holds a stale or partial record
+                    stats['timeouts'] += 1
+                    continue
+
+                raw = {}
+                for ch in channels:
+                    raw[ch] = self.raw_data(ch, **kwargs)
+
+                blocked = time.perf_counter()
+                pending.put((k, raw))
+                stats['blocked_sec'] += time.perf_counter() - blocked
+                stats['captures'] += 1
+        finally:
+            pending.put(None)
+            thread.join()
+
+        stats['elapsed_sec'] = time.perf_counter() - start
+        if stats['elapsed_sec'] > 0:
+            stats['captures_per_sec'] = stats['captures'] / stats['elapsed_sec']
+
+        if self.verbose:
+            print(f'[INFO] {stats["captures"]} captures at {stats["captures_per_sec"]:.2f} captures/sec')
+
+        if errors:
+            raise errors[0]
+
+        return stats
+
+    def export(self, waveforms, filename, format = 'csv', background = False, **kwargs):
+        """ Export several waveforms against a common time column in large blocks (see wavexport)
+
+        :waveforms: dictionary of name : (v, t, preamble) as returned by data()
+
+        :filename: written at datastorage_path, the format extension is added if missing
+
+        :format: 'csv', 'npz', or 'bin'
+
+        :background: True to write on a worker thread and return a concurrent.futures.Future
+
+        :kwargs: passed to wavexport.export (e.g., time_label, dtype)
+
+        :return: the path written (or a Future of it when background)
+        """
+        filename = os.path.join(self.datastorage_path, filename)
+
+        if not background:
+            return wavexport.export(waveforms, filename, format = format, **kwargs)
+
+        future = Future()
+        def worker():
+            try:
+                future.set_result(wavexport.export(waveforms, filename, format = format, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target = worker, daemon = True).start()
+
+        return future
+
+    def save_setup(self, name = None):
+        """ Read the complete scope setup in a single transfer
+
+        :name: (Optional) also cache the setup as <name>.setup at datastorage_path for restore_setup(name)
+
+        :return: the setup as bytes, None if the query was unsuccessful (nothing is cached)
+        """
+        setup = self._read_setup()
+        if setup is None:
+            print('[WARNING] Unable to read the setup')
+            return None
+
+        if name is not None:
+            with open(os.path.join(self.datastorage_path, name + '.setup'), 'wb') as f:
+                f.write(setup)
+
+        return setup
+
+    def restore_setup(self, setup):
+        """ Apply a complete scope setup in a single transfer instead of setting each
+        channel, trigger, and timebase parameter in turn
+
+        :setup: bytes returned by save_setup() or the name of a setup cached by save_setup(name)
+        """
+        if isinstance(setup, str):
+            filename = os.path.join(self.datastorage_path, setup + '.setup')
+            if not os.path.exists(filename):
+                raise FileNotFoundError(f'No setup named {setup} at {self.datastorage_path}')
+            with open(filename, 'rb') as f:
+                setup = f.read()
+        elif not isinstance(setup, (bytes, bytearray)):
+            raise TypeError('setup must be bytes from save_setup() or the name of a cached setup')
+
+        self._write_setup(bytes(setup))
+
+    def _read_setup(self):
+        """ Vendor specific setup query, returns bytes or None if the query was unsuccessful
+        """
+        raise NotImplementedError
+
+    def _write_setup(self, setup):
+        """ Vendor specific setup restore from bytes returned by _read_setup
+        """
+        raise NotImplementedError
+
     def sample_rate(self):
         """ Return current sample rate in Sa/s
         """
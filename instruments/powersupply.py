@@ -32,6 +32,30 @@ class PowerSupply(Device):
         '''      
         raise NotImplementedError
 
+    def _check_setting(self, channel, name, value):
+        ''' apply() is held to the same limits as volt_setpoint and current_setpoint
+        '''
+        if channel is not None and channel not in range(1,self.NUM_CHANNELS+1):
+            raise ValueError (f'channel {channel} out of range: must be 1 through {self.NUM_CHANNELS}')
+
+        if 'volt_setpoint' == name:
+            if not isinstance(value, (int, float)):
+                raise TypeError('voltage must be numeric value')
+            if (value < 0) or (value > self.safety_voltage):
+                raise ValueError(f'voltage out of range: must be between 0 and safety_voltage {self.safety_voltage}')
+
+        elif 'current_setpoint' == name:
+            if not isinstance(value, (int, float)):
+                raise TypeError('current must be numeric value')
+            if (value < 0.00) or (value > self.MAX_CURRENT):
+                raise ValueError(f'amps out of range: must be 0.0 through {self.MAX_CURRENT}')
+
+    def _applied(self, written):
+        for channel in written:
+            if isinstance(channel, int):
+                self._last_voltage_setpoint = written[channel].get('volt_setpoint', self._last_voltage_setpoint)
+                self._last_current_setpoint = written[channel].get('current_setpoint', self._last_current_setpoint)
+
     @property
     def measure_delay(self):
         return self._measure_delay
@@ -15,6 +15,7 @@ import time
 
 # Local
 from ..oscope import Oscilloscope
+from .. import wavestore
 
 # These dictionaries conveniently convert between types, values, and strings
 sourcedict = {  None        : None,
@@ -165,9 +166,23 @@ class DS1000Z(Oscilloscope):
     MAX_DATA_POINTS = 12000000
     MAX_DATA_BATCH  = 250000
 
+    # See Device.apply(), offsets and positions use this driver's convention
+    COMPOUND_COMMANDS = False
+    SETTINGS = {    'display'             : (':CHANnel{channel}:DISPlay?', ':CHANnel{channel}:DISPlay {value}', lambda r: displaydict[int(r)], lambda v: displaydict[v]),
+                    'units'               : (':CHANnel{channel}:UNITs?', ':CHANnel{channel}:UNITs {value}', lambda r: unitdict[r], lambda v: unitdict[v]),
+                    'probe_scale'         : (':CHANnel{channel}:PROBe?', ':CHANnel{channel}:PROBe {value}', float, None),
+                    'vertical_scale'      : (':CHANnel{channel}:SCALe?', ':CHANnel{channel}:SCALe {value}', float, None),
+                    'vertical_position'   : (':CHANnel{channel}:OFFSet?', ':CHANnel{channel}:OFFSet {value}', lambda r: -float(r), lambda v: -v),
+                    'horizontal_scale'    : (':TIMebase:MAIN:SCALe?', ':TIMebase:MAIN:SCALe {value}', float, None),
+                    'horizontal_position' : (':TIMebase:MAIN:OFFSet?', ':TIMebase:MAIN:OFFSet {value}', lambda r: -float(r), lambda v: -v)
+               }
+
     def __init__(self,*args, **kwargs):
         super(DS1000Z, self).__init__(*args, **kwargs)
 
+        self._frames = 0    # Waveform record frames captured on run(), see segmented_acquisition
+        self._measure_slots = None  # (source, measuretype, statistics) see configure_measurements
+
     def display(self, channel, state = Oscilloscope.DisplayState.QUERY):
         if not isinstance(channel, int):
             raise TypeError('channel must an integer type')
@@ -317,6 +332,9 @@ class DS1000Z(Oscilloscope):
         self.command(":RUN")
         self.sweep(trigsweep)
 
+        if self._frames > 0:
+            self.command(':FUNCtion:WRECord:OPERate RUN')
+
     def stop(self):
         self.command(":STOP")
 
@@ -427,8 +445,95 @@ class DS1000Z(Oscilloscope):
 
         return result
 
+    # NOTE: measure() ends with :MEASure:CLEar ALL which also removes these measurements
+    def configure_measurements(self, channel, measuretype = None, statistics = False):
+        if not isinstance(channel, int):
+            raise TypeError('channel must an integer type')
+
+        if measuretype is None:
+            measuretype = list(self.Measurements)
+        elif isinstance(measuretype, self.Measurements):
+            measuretype = [measuretype]
+        elif not isinstance(measuretype, (tuple, list)):
+            raise TypeError('measuretype must be a value or tuple of Measurements enum')
+
+        for m in measuretype:
+            if m not in measuredict:
+                raise ValueError(f'{m} is not supported by this oscilloscope')
+
+        if not isinstance(statistics, bool):
+            raise TypeError('statistics must be bool')
+
+        if len(measuretype) > 5:
+            print(f'[WARNING] only the last 5 of {len(measuretype)} measurements are displayed by this scope')
+
+        source = f'CHANnel{channel}'
+        self.command(':MEASure:CLEar ALL')
+
+        # Force threshold to be standard 10/50/90 %
+        self.command(':MEASure:SETup:MIN 10')
+        self.command(':MEASure:SETup:MID 50')
+        self.command(':MEASure:SETup:MAX 90')
+
+        if statistics:
+            self.command(':MEASure:STATistic:MODE EXTRemum')
+            self.command(':MEASure:STATistic:DISPlay ON')
+            self.command(':MEASure:STATistic:RESet')
+            for m in measuretype:
+                self.command(f':MEASure:STATistic:ITEM {measuredict[m]},{source}')
+        else:
+            self.command(':MEASure:STATistic:DISPlay OFF')
+            for m in measuretype:
+                self.command(f':MEASure:ITEM {measuredict[m]},{source}')
+
+        self._measure_slots = (source, list(measuretype), statistics)
+
+    # NOTE: This scope does not answer compound queries so each value is its own query,
+    # but without re-selecting the source or waiting for it to stabilize as in measure()
+    def read_measurements(self):
+        if self._measure_slots is None:
+            raise ValueError('configure_measurements must be called before read_measurements')
+
+        source, measuretype, statistics = self._measure_slots
+
+        result = {}
+        for m in measuretype:
+            if statistics:
+                stats = {}
+                for key, stat in (('value', 'CURRent'), ('mean', 'AVERages'), ('stddev', 'DEViation'), ('min', 'MINimum'), ('max', 'MAXimum')):
+                    stats[key] = self.query_float(f':MEASure:STATistic:ITEM? {stat},{measuredict[m]},{source}')
+                stats['population'] = nan   # Not reported by this scope
+                result.update({m : stats})
+            else:
+                result.update({m : [self.query_float(f':MEASure:ITEM? {measuredict[m]},{source}')]})
+
+        return result
+
     # Rigol has a 1200 point limit in normal waveform mode
-    def data(self, channel, startstop = None, encoding = Oscilloscope.DataEncoding.ASCII):
+    def data(self, channel, startstop = None, encoding = Oscilloscope.DataEncoding.ASCII, filename = None):
+        if filename is None:
+            return self.decode_data(self._transfer(channel, startstop, encoding))
+        return self._transfer(channel, startstop, encoding, filename)
+
+    def raw_data(self, channel, startstop = None, encoding = Oscilloscope.DataEncoding.ASCII):
+        return self._transfer(channel, startstop, encoding)
+
+    def decode_data(self, raw):
+        batches, dtype, preamble = raw
+        if len(batches) == 0:
+            return np.array([], dtype=dtype), np.array([]), preamble
+
+        result = np.concatenate(batches)
+        t = np.arange(len(result)) * preamble['xincr']
+
+        return result, t, preamble
+
+    def _transfer(self, channel, startstop, encoding, filename = None):
+        ''' Read :WAVeform:DATA? in batches
+
+        Returns the batches, their dtype, and the preamble (see decode_data), or with filename
+        v, t, preamble of the store the batches were written into
+        '''
         v = self.verbose
         self.verbose = False
 
@@ -511,10 +616,14 @@ class DS1000Z(Oscilloscope):
         else:
             points = stop - start + 1
 
-        if self.DataEncoding.ASCII == encoding:
-            result = np.array([],dtype=np.float32)
-        else:
-            result = np.array([], dtype=np.uint8)
+        dtype = np.float32 if self.DataEncoding.ASCII == encoding else np.uint8
+
+        # Batches are collected and joined once, or written straight into the on-disk store
+        result = []
+        received = 0
+        if filename is not None:
+            filename = os.path.join(self.datastorage_path, filename)
+            store = wavestore.create(filename, points, preamble, dtype = dtype)
 
         while points > 0:
             print('.',end='')
@@ -545,7 +654,13 @@ class DS1000Z(Oscilloscope):
 
             if _result is not None:
                 points -= len(_result)
-                result = np.append(result, _result)
+
+                if filename is None:
+                    result.append(_result)
+                else:
+                    n = min(len(_result), len(store[0]) - received)
+                    store[0][received:received + n] = _result[:n]
+                received += len(_result)
 
                 if len(_result) > 1200:
                     start = start + len(_result)
@@ -558,13 +673,79 @@ class DS1000Z(Oscilloscope):
         print('')
         self.verbose = v
 
-        if len(result) != 0:
-            t = np.arange(0, preamble['xincr'] * len(result), preamble['xincr'])
-        else:
-            t = np.array([])
+        if filename is None:
+            return result, dtype, preamble
+
+        result, t = wavestore.close(filename, *store, received, preamble)
 
         return result, t, preamble
 
+    # Rigol calls segmented acquisition "waveform record" and reads it back in "waveform playback"
+    def segmented_acquisition(self, frames = None):
+        if frames is None:
+            if displaydict.get(self.query_int(':FUNCtion:WRECord:ENABle?')) is Oscilloscope.DisplayState.ON:
+                return self.query_int(':FUNCtion:WRECord:FEND?')
+            return 0
+
+        if not isinstance(frames, int):
+            raise TypeError('frames must be an integer type')
+
+        if frames < 0:
+            raise ValueError('frames must be >= 0')
+
+        if frames == 0:
+            self.command(':FUNCtion:WRECord:ENABle OFF')
+        else:
+            self.command(':FUNCtion:WRECord:ENABle ON')
+            self.command(f':FUNCtion:WRECord:FEND {frames}')
+
+        self._frames = frames
+
+    # NOTE: This scope can only transfer the frame currently selected for playback so
+    # the frames are read one at a time, but without re-arming the trigger between them
+    def segmented_data(self, channel, frames = None, encoding = Oscilloscope.DataEncoding.ASCII):
+        acquired = self.query_int(':FUNCtion:WREPlay:FMAX?')
+        if frames is None:
+            frames = acquired
+        elif not isinstance(frames, int):
+            raise TypeError('frames must be an integer type or None')
+        elif acquired is not None and frames > acquired:
+            print(f'[WARNING] only {acquired} frames acquired: {frames} requested')
+            frames = acquired
+
+        if frames is None or frames < 1:
+            return np.empty((0,0)), np.array([]), np.array([]), None
+
+        result = None
+        for k in range(frames):
+            self.command(f':FUNCtion:WREPlay:FCURrent {k + 1}')
+            _result, t, preamble = self.data(channel, encoding = encoding)
+            if result is None:
+                result = np.full((frames, len(_result)), nan)
+            n = min(len(_result), result.shape[1])
+            result[k,:n] = _result[:n]
+
+        # The scope does not report trigger time of each frame so use the record interval
+        interval = self.query_float(':FUNCtion:WRECord:FINTerval?')
+        timestamps = np.arange(frames) * (nan if interval is None else interval)
+
+        if preamble is not None:
+            preamble['count'] = frames
+
+        return result, t, timestamps, preamble
+
+    # The setup is an opaque binary block read and written with the :SYSTem:SETup command
+    def _read_setup(self):
+        return bytes(self.query_binary(':SYSTem:SETup?'))
+
+    def _write_setup(self, setup):
+        self.command_binary(':SYSTem:SETup ', setup)
+        self.wait_op_complete()
+
+        # Re-synchronize state programmed through this driver
+        self._frames = self.segmented_acquisition() or 0
+        self._measure_slots = None
+
     def sample_rate(self):
         return self.query_float(':ACQuire:SRATe?')
 
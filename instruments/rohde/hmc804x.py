@@ -25,6 +25,11 @@ class HMC804X(PowerSupply):
     MIN_CURRENT = 0.005  # Unique to this device, will be silent about it
     MAX_CURRENT = 3.0    # Assume minimum current generically
 
+    # See Device.apply(), the channel is selected in the same message
+    SETTINGS = {    'volt_setpoint'     : (':INSTrument OUT{channel};:VOLTage?', ':INSTrument OUT{channel};:VOLTage {value}', float, None),
+                    'current_setpoint'  : (':INSTrument OUT{channel};:CURRent?', ':INSTrument OUT{channel};:CURRent {value}', float, None)
+               }
+
     def __init__(self,*args, **kwargs):
         super(HMC804X, self).__init__(*args, **kwargs)
 
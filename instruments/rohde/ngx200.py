@@ -25,6 +25,11 @@ class NGX200(PowerSupply):
     MIN_CURRENT = 0.01  # Unique to this device, will be silent about it
     MAX_CURRENT = 6.01  # When <= 6V, 3.01 A when > 6V; see autoresponse in real device
 
+    # See Device.apply(), the channel is selected in the same message
+    SETTINGS = {    'volt_setpoint'     : (':INSTrument OUT{channel};:VOLTage?', ':INSTrument OUT{channel};:VOLTage {value}', float, None),
+                    'current_setpoint'  : (':INSTrument OUT{channel};:CURRent?', ':INSTrument OUT{channel};:CURRent {value}', float, None)
+               }
+
     def __init__(self,*args, **kwargs):
         super(NGX200, self).__init__(*args, **kwargs)
 
@@ -5,12 +5,14 @@
 # Logic 4
 
 # Standard
-import csv
 import enum
 import os
 import platform
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 # 3rd party
 from matplotlib import pyplot as pl
@@ -19,6 +21,8 @@ import numpy as np
 # Local
 from instruments.saleae import saleae   # A non-SCPI compliant API
 from instruments.analyzer import Analyzer
+from instruments.decimate import minmax
+from instruments.logiccapture import LogicCapture
 
 # Re-define the Analyzer base to be derived from the Saleae API
 Base = Analyzer.create_type(saleae.Device)
@@ -28,6 +32,169 @@ class DigitalVoltageFlags(enum.IntEnum):
     NotSelected = 0
     Selected = 1
 
+# Hex digit values for bulk parsing of exported data words
+# NOTE: 'x' maps to 0 so that a "0x" prefix does not change the value and
+# padding, spaces and carriage returns (-1) are skipped
+_HEXLUT = np.full(256, -1, dtype=np.int64)
+for _i, _c in enumerate(b'0123456789abcdef'):
+    _HEXLUT[_c] = _i
+    _HEXLUT[bytes([_c]).upper()[0]] = _i
+_HEXLUT[ord('x')] = 0
+_HEXLUT[ord('X')] = 0
+
+def read_csv(filepath):
+    ''' Read a digital CSV export (time column, hex data column) in bulk
+
+    The file is read at once, the time column is converted as a single array and the hex
+    words are decoded a character column at a time for all rows
+
+    Returns:
+
+    t : time of each row
+
+    words : the data word of each row (bit n is the n-th recorded channel)
+    '''
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+
+    # Skip the header row, if any
+    first = raw.split(b'\n', 1)[0]
+    if b'Time' in first or b'Data' in first:
+        raw = raw[len(first) + 1:]
+
+    fields = raw.replace(b'\n', b',').split(b',')
+    if len(fields) and fields[-1].strip() == b'':
+        fields.pop()
+
+    if len(fields) % 2:
+        raise ValueError(f'{filepath} must have exactly two columns (time, hex data)')
+
+    if len(fields) == 0:
+        return np.array([]), np.array([], dtype=np.int64)
+
+    t = np.array(fields[0::2]).astype(np.float64)
+
+    hexdata = np.array(fields[1::2])    # Fixed width, NUL padded
+    chars = hexdata.view(np.uint8).reshape(len(hexdata), hexdata.itemsize)
+    digits = _HEXLUT[chars]
+    if np.any((digits < 0) & ~np.isin(chars, (0, ord(' '), ord('\r')))):
+        raise ValueError(f'{filepath} has data that is not hex')
+
+    words = np.zeros(len(hexdata), dtype=np.int64)
+    for j in range(digits.shape[1]):
+        d = digits[:, j]
+        valid = d >= 0
+        words[valid] = (words[valid] << 4) | d[valid]
+
+    return t, words
+
+def read_binary(filepath, sample_rate, each_sample=False, word_size=16, t0=0.0):
+    ''' Memory-map a digital binary export (see export_data(format='binary'))
+
+    Layout (little endian):
+        EACH_SAMPLE : one word per sample
+        ON_CHANGE   : uint64 sample number followed by the word, for each change
+
+    t0 : time of sample 0. Binary exports count samples from the start of the capture while CSV
+    exports give times relative to the trigger, so pass minus the trigger time (see
+    Logic.align_binary) for times that agree with read_csv
+
+    Returns:
+
+    t : time of each word (t0 + seconds from the start of the capture)
+
+    words : the data words as a read-only memory map (bit n is the n-th recorded channel)
+    '''
+    if word_size not in (8, 16, 32, 64):
+        raise ValueError('word_size must be 8, 16, 32, or 64')
+
+    if not sample_rate:
+        raise ValueError('sample_rate is required to convert sample numbers to time')
+
+    wtype = np.dtype(f'<u{word_size // 8}')
+
+    if os.path.getsize(filepath) == 0:
+        return np.array([]), np.array([], dtype=wtype)
+
+    if each_sample:
+        words = np.memmap(filepath, dtype=wtype, mode='r')
+        t = t0 + np.arange(len(words)) / sample_rate
+    else:
+        records = np.memmap(filepath, dtype=np.dtype([('sample', '<u8'), ('word', wtype)]), mode='r')
+        words = records['word']
+        t = t0 + records['sample'] / sample_rate
+
+    return t, words
+
+BLOCK_ROWS = 1 << 18     # Rows formatted and written at a time by write_csv
+
+def write_csv(filepath, t, words, num_channels, headers=True):
+    ''' Write a digital CSV export (time column, hex data column) that read_csv can load
+
+    Rows are formatted in blocks: the times with a single array conversion and the
+    hex words from their nibbles through a lookup table
+    '''
+    width = max(1, (num_channels + 3) // 4)
+    shifts = np.arange(4 * (width - 1), -1, -4, dtype=np.uint64)
+    digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+    t = np.asarray(t, dtype=np.float64)
+    words = np.asarray(words).astype(np.uint64)
+
+    with open(filepath, mode='wb') as f:
+        if headers:
+            f.write(b'Time (s),Data (hex)\n')
+        for i in range(0, len(t), BLOCK_ROWS):
+            w = words[i:i + BLOCK_ROWS]
+            hexdata = np.ascontiguousarray(digits[(w[:, None] >> shifts) & np.uint64(0xF)]).view(f'S{width}').ravel()
+            rows = np.char.add(np.char.add(t[i:i + BLOCK_ROWS].astype('S'), b','), hexdata)
+            f.write(b'\n'.join(rows.tolist()) + b'\n')
+
+def write_binary(filepath, t, words, sample_rate, word_size=16, t0=0.0):
+    ''' Write an ON_CHANGE binary export (uint64 sample number followed by the word) that read_binary can map
+
+    t0 : time of sample 0 (see read_binary)
+    '''
+    if word_size not in (8, 16, 32, 64):
+        raise ValueError('word_size must be 8, 16, 32, or 64')
+
+    records = np.zeros(len(t), dtype=np.dtype([('sample', '<u8'), ('word', f'<u{word_size // 8}')]))
+    records['sample'] = np.rint((np.asarray(t) - t0) * sample_rate)
+    records['word'] = words
+    records.tofile(filepath)
+
+def stitch(parts):
+    ''' Join the (t, words) of exports of consecutive time spans into one record
+
+    Rows a part repeats from before its start (the spans share their end points) are dropped,
+    as is the first row of a part when it only restates the value the previous part ended with
+    '''
+    ts = []
+    ws = []
+    last_t = None
+    last_word = None
+    for t, words in parts:
+        t = np.asarray(t)
+        words = np.asarray(words)
+        if last_t is not None:
+            i = np.searchsorted(t, last_t, side='right')
+            t = t[i:]
+            words = words[i:]
+            if len(words) and words[0] == last_word:
+                t = t[1:]
+                words = words[1:]
+
+        if len(t):
+            ts.append(t)
+            ws.append(words)
+            last_t = t[-1]
+            last_word = words[-1]
+
+    if len(ts) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    return np.concatenate(ts), np.concatenate(ws)
+
 class ConnectedDevice():
 
     def __init__(self, type, name, id, index, active):
@@ -62,12 +229,19 @@ class Logic(Base):
 
     instance = False
 
-    def __init__(self, la_type_str, *args, **kwargs):
+    def __init__(self, la_type_str, *args, datastorage_path=None, **kwargs):
         if Logic.instance:
             raise UserWarning('More than one instance of Logic(Saleae not allowed)')
         
         Logic.instance = True
 
+        self._sample_rate = None        # (digital, analog) last set, see set_sample_rate
+        self._binary_export = {}        # Settings of the last binary export, see load_binary
+        self._binary_t0 = 0.0           # Time of sample 0 in binary exports, see align_binary
+        self._capture_seconds = None    # Capture length last set, see export_sharded
+        self._num_samples = None
+        self._verbose = False           # Summaries like scpi.Device, see capture_loop
+
         super(Logic, self).__init__(Base, *args, **kwargs)
 
         devices = self.get_connected_devices()
@@ -84,8 +258,10 @@ class Logic(Base):
         # Reset touched flag so we can detect use after construction
         self._touched = False
 
-        # The following is a standalone default but can be overridden by property
-        if 'win32' in sys.platform:
+        # The following is a standalone default but can be overridden by argument or property
+        if datastorage_path is not None:
+            self._datastorage_path = datastorage_path
+        elif 'win32' in sys.platform:
             self._datastorage_path = 'C:\\Users\\Public\\LogicAnalyzerData\\'
         else:
             self._datastorage_path = '/Users/Public/LogicAnalyzerData/'
@@ -95,6 +271,16 @@ class Logic(Base):
 
     # Implement the Logic functions using the Base API
 
+    @property
+    def verbose(self):
+        return self._verbose
+
+    @verbose.setter
+    def verbose(self, val):
+        if not isinstance(val, bool):
+            raise TypeError('verbose must be bool')
+        self._verbose = val
+
     @property
     def datastorage_path(self):
         return self._datastorage_path
@@ -102,7 +288,7 @@ class Logic(Base):
     @datastorage_path.setter
     def datastorage_path(self,value):
         if not os.path.exists(value):
-            os.mkdir(value) # Exception raised here if invalid for some reason
+            os.makedirs(value) # Exception raised here if invalid for some reason
         if value != self._datastorage_path:
             print(f'[INFO] Data Storage Path for {self.id} changed to {value}')        
         self._datastorage_path = value
@@ -354,6 +540,57 @@ class Logic(Base):
             self._build(['{0:d}'.format(ch) for ch in analog])
         self._finish()
 
+    def configure(self, digital=None, analog=None, sample_rate=None, capture_seconds=None, num_samples=None):
+        ''' Apply several capture settings in one round trip (the commands are pipelined, see _cmd_many)
+
+        Settings left as None are not changed. They are sent in the order channels, sample rate, capture
+        length since the valid sample rates depend on the active channels (see set_sample_rate)
+
+        :raises ImpossibleSettings: naming the settings the Logic software rejected, the others are applied
+
+        >>> s.configure(digital=[0, 1, 2, 3], sample_rate=(100000000, 0), capture_seconds=0.5)
+        '''
+        if capture_seconds is not None and num_samples is not None:
+            raise ValueError('give capture_seconds or num_samples, not both')
+
+        commands = []
+        names = []
+        if digital is not None or analog is not None:
+            channels = ['SET_ACTIVE_CHANNELS']
+            if digital:
+                channels += ['digital_channels'] + ['{0:d}'.format(ch) for ch in digital]
+            if analog:
+                channels += ['analog_channels'] + ['{0:d}'.format(ch) for ch in analog]
+            if len(channels) == 1:
+                raise self.ImpossibleSettings('Logic requires at least one activate channel (digital or analog) and none are given')
+            commands.append(', '.join(channels))
+            names.append('channels')
+        if sample_rate is not None:
+            commands.append('SET_SAMPLE_RATE, {}, {}'.format(*sample_rate))
+            names.append('sample_rate')
+        if capture_seconds is not None:
+            commands.append('SET_CAPTURE_SECONDS, {}'.format(float(capture_seconds)))
+            names.append('capture_seconds')
+        if num_samples is not None:
+            commands.append('SET_NUM_SAMPLES, {:d}'.format(int(num_samples)))
+            names.append('num_samples')
+
+        replies = self._cmd_many(commands, expect_nak=True)
+        accepted = {name for name, reply in zip(names, replies) if reply is not None}
+
+        if 'sample_rate' in accepted:
+            self._sample_rate = tuple(sample_rate)
+        if 'capture_seconds' in accepted:
+            self._capture_seconds = float(capture_seconds)
+            self._num_samples = None
+        if 'num_samples' in accepted:
+            self._num_samples = int(num_samples)
+            self._capture_seconds = None
+
+        rejected = [name for name in names if name not in accepted]
+        if rejected:
+            raise self.ImpossibleSettings(f'Logic rejected {", ".join(rejected)}')
+
     def activate_all_channels(self):
         ''' activates all DIGITAL channels
 
@@ -435,6 +672,8 @@ class Logic(Base):
         >>> s.set_num_samples(1e6)
         '''
         self._cmd('SET_NUM_SAMPLES, {:d}'.format(int(samples)))
+        self._num_samples = int(samples)
+        self._capture_seconds = None
 
     def get_num_samples(self):
     #TODO These functions should call functions in saleae that interface with the hardware, to allow changes to the interface
@@ -459,6 +698,8 @@ class Logic(Base):
         >>> s.set_capture_seconds(1)
         '''
         self._cmd('SET_CAPTURE_SECONDS, {}'.format(float(seconds)))
+        self._capture_seconds = float(seconds)
+        self._num_samples = None
 
     def set_sample_rate(self, sample_rate_tuple):
     #TODO These functions should call functions in saleae that interface with the hardware, to allow changes to the interface
@@ -481,6 +722,7 @@ class Logic(Base):
             raise NotImplementedError("Unsupported sample rate")
 
         self._cmd('SET_SAMPLE_RATE, {}, {}'.format(*sample_rate_tuple))
+        self._sample_rate = tuple(sample_rate_tuple)
 
     def set_sample_rate_by_minimum(self, digital_minimum=0, analog_minimum=0):
         '''Set to a valid sample rate given current configuration and a target.
@@ -561,6 +803,8 @@ class Logic(Base):
         resp = None
         while not done:
             resp = self._cmd('IS_PROCESSING_COMPLETE', expect_nak=True)
+            if resp is not None and resp.strip().upper() == 'TRUE':
+                break
             if timeout > 0.0:
                 time.sleep(0.100)   # Aproximate 10 Hz polling
             if time.perf_counter() - starttime > timeout:
@@ -627,7 +871,7 @@ class Logic(Base):
         file_path_on_target_machine.replace('\\', '/')
         self._cmd('LOAD_FROM_FILE, ' + os.path.abspath(file_path_on_target_machine))
 
-    def export_data(self, filename, digital_channels=None, analog_channels=None, time_span=None, format='csv', timeout=5.0, **export_args):
+    def export_data(self, filename, digital_channels=None, analog_channels=None, time_span=None, format='csv', timeout=5.0, wait=True, **export_args):
     #TODO These functions should call functions in saleae that interface with the hardware, to allow changes to the interface
     #to be transparent
         '''Export command:
@@ -637,6 +881,9 @@ class Logic(Base):
             [ALL_TIME|TIME_SPAN, <(double)start>, <(double)end>],
             [BINARY, <binary settings>|CSV, <csv settings>|VCD|MATLAB, <matlab settings>]
 
+        wait : True to return once the file is written (see wait_for_file), False to return as soon as
+        the Logic software accepts the command
+
         >>> s.export_data2('/tmp/test.csv')
         '''
 
@@ -702,12 +949,343 @@ class Logic(Base):
             self._build(format.upper())
             getattr(self, export_name)(**export_args)
 
+            if 'binary' == format.lower():
+                # Remember the layout so load_binary can interpret the file
+                self._binary_export = {'each_sample' : export_args.get('each_sample', True),
+                                       'word_size'   : export_args.get('word_size', 16)}
+
+            # A previous file of the same name must not look like this export
+            if os.path.exists(file_path_on_target_machine):
+                os.remove(file_path_on_target_machine)
+
             self._finish()
-            time.sleep(0.5) # HACK: Delete me when Logic (saleae) race conditions are fixed
+            if wait and not self.wait_for_file(filename, timeout):
+                print(f'[WARNING] Export to {file_path_on_target_machine} was not written within {timeout} seconds')
         else:
             print(f'[WARNING] Unable to Export Data: Processing was not completed')
 
 
+    def wait_for_file(self, filename, timeout=5.0, poll_sec=0.05):
+        ''' Wait for filename in datastorage_path to exist with a size that has stopped changing
+        (the Logic software may still be writing an export after it acknowledges the command)
+
+        NOTE: an empty file is never ready since every export has at least a header or one row
+
+        Returns True when the file is ready, False on timeout
+        '''
+        filepath = os.path.join(self.datastorage_path, filename)
+        deadline = time.perf_counter() + timeout
+        size = None
+        while time.perf_counter() < deadline:
+            if os.path.exists(filepath):
+                latest = os.path.getsize(filepath)
+                if latest == size and latest > 0:
+                    return True
+                size = latest
+            time.sleep(poll_sec)
+
+        return False
+
+    def capture_loop(self, n, sink, filename='capture', format='binary', queue_depth=2, poll_sec=0.01, timeout=10.0, keep_files=False, **export_args):
+        ''' Repeat n captures back to back. Capture k is exported and capture k+1 started right away,
+        then a worker thread waits for the export file, parses it, and hands it to sink, so only the
+        export command separates consecutive captures
+
+        :sink: callable as sink(k, t, data) with t, data as returned by data()
+
+        :filename: base name of the export files, capture k is <filename>_<k>.bin (or .csv)
+
+        :format: 'binary' (ON_CHANGE unless each_sample is given, fastest to load) or 'csv'
+
+        :queue_depth: captures allowed to wait for the worker; the loop blocks when the worker
+        falls this far behind (back-pressure)
+
+        :poll_sec: interval for polling capture completion
+
+        :timeout: seconds to wait for a capture to complete or an export file to be written
+
+        :keep_files: False to delete each export file once it is parsed
+
+        :export_args: passed to export_data (e.g., digital_channels, word_size)
+
+        :return: dictionary of statistics: captures, timeouts, elapsed_sec, captures_per_sec,
+        blocked_sec (time the loop waited on the worker), dead_sec (total time between the end of
+        one capture and the start of the next), and max_dead_sec
+        '''
+        if not isinstance(n, int) or n < 1:
+            raise ValueError('n must be an integer > 0')
+
+        if not callable(sink):
+            raise TypeError('sink must be callable as sink(k, t, data)')
+
+        if not isinstance(queue_depth, int) or queue_depth < 1:
+            raise ValueError('queue_depth must be an integer > 0')
+
+        if format not in ('binary', 'csv'):
+            raise ValueError("format must be 'binary' or 'csv'")
+
+        extension = '.bin' if 'binary' == format else '.csv'
+        if 'binary' == format:
+            export_args.setdefault('each_sample', False)
+
+        pending = queue.Queue(maxsize = queue_depth)
+        errors = []
+
+        def worker():
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                if not errors:  # After a failure just drain so the loop cannot block
+                    k, name = item
+                    try:
+                        if not self.wait_for_file(name, timeout):
+                            raise TimeoutError(f'{name} was not written within {timeout} seconds')
+
+                        # Copied into memory so the file can be removed (or overwritten) while the sink holds the data
+                        t, data = self.data(name, plotit = False)
+                        t = np.array(t)
+                        data = LogicCapture(t, np.array(data.words), self.NUM_CHANNELS)
+                        if not keep_files:
+                            os.remove(os.path.join(self.datastorage_path, name))
+
+                        sink(k, t, data)
+                    except Exception as e:
+                        errors.append(e)
+
+        thread = threading.Thread(target = worker, daemon = True)
+        thread.start()
+
+        stats = {'captures' : 0, 'timeouts' : 0, 'elapsed_sec' : 0.0, 'captures_per_sec' : 0.0, 'blocked_sec' : 0.0, 'dead_sec' : 0.0, 'max_dead_sec' : 0.0}
+        start = time.perf_counter()
+        try:
+            self.capture_start()
+            for k in range(n):
+                if errors:
+                    break
+
+                deadline = time.perf_counter() + timeout
+                while not self.is_processing_complete():
+                    if time.perf_counter() > deadline:
+                        stats['timeouts'] += 1
+                        self.capture_stop()
+                        break
+                    time.sleep(poll_sec)
+                done = time.perf_counter()
+
+                name = f'{filename}_{k}{extension}'
+                self.export_data(name, format = format, timeout = timeout, wait = False, **export_args)
+
+                if k + 1 < n:
+                    self.capture_start()
+                    dead = time.perf_counter() - done
+                    stats['dead_sec'] += dead
+                    stats['max_dead_sec'] = max(stats['max_dead_sec'], dead)
+
+                blocked = time.perf_counter()
+                pending.put((k, name))
+                stats['blocked_sec'] += time.perf_counter() - blocked
+                stats['captures'] += 1
+        finally:
+            pending.put(None)
+            thread.join()
+
+        stats['elapsed_sec'] = time.perf_counter() - start
+        if stats['elapsed_sec'] > 0:
+            stats['captures_per_sec'] = stats['captures'] / stats['elapsed_sec']
+
+        if self.verbose:
+            print(f'[INFO] {stats["captures"]} captures at {stats["captures_per_sec"]:.2f} captures/sec, {stats["dead_sec"]:.3f} sec dead time (max {stats["max_dead_sec"]:.3f} sec)')
+
+        if errors:
+            raise errors[0]
+
+        return stats
+
+    def export_sharded(self, filename, shards=None, time_span=None, format='csv', workers=None, timeout=5.0, keep_files=False, **export_args):
+        ''' Export a long capture as shards (consecutive time spans) and parse them in parallel
+
+        Each shard is exported in turn (the Logic software handles one command at a time) and handed
+        to a process pool as soon as it is written, so parsing overlaps the remaining exports. The
+        shards are then joined with stitch().
+
+        :shards: number of time spans, None for one per worker
+
+        :time_span: (start, end) seconds relative to the trigger, None for the whole capture (from
+        its first sample, which is before the trigger when there is pretrigger data, for the
+        length last set with set_capture_seconds or set_num_samples and set_sample_rate)
+
+        :format: 'csv' (parsed in worker processes) or 'binary' (ON_CHANGE only, mapped in this
+        process since there is nothing to parse). Binary shards are put on the CSV time origin
+        (binary_t0 is aligned to this capture) so both formats return the same times
+
+        :workers: worker processes, None for one per CPU
+
+        :keep_files: False to delete the shard files once they are loaded
+
+        :export_args: passed to export_data (e.g., digital_channels, word_size)
+
+        Returns t, data as from data()
+
+        NOTE: On Windows the calling script must guard its entry point with if __name__ == '__main__'
+        so the worker processes can start
+        '''
+        if '\\' in filename or '/' in filename:
+            raise ValueError(f'{filename} must not have path in it (use datastorage_path property)')
+
+        if format not in ('csv', 'binary'):
+            raise ValueError("format must be 'csv' or 'binary'")
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if shards is None:
+            shards = workers
+        if not isinstance(shards, int) or shards < 1:
+            raise ValueError('shards must be an integer > 0')
+
+        if 'binary' == format:
+            if export_args.get('each_sample', False):
+                raise ValueError('binary shards must be ON_CHANGE (each_sample=False) to keep their time stamps')
+            export_args['each_sample'] = False
+
+        base, extension = os.path.splitext(filename)
+
+        if time_span is None:
+            if self._capture_seconds is not None:
+                length = self._capture_seconds
+            elif self._num_samples is not None and self._sample_rate is not None:
+                length = self._num_samples / self._sample_rate[0]
+            else:
+                raise ValueError('time_span is required when the capture length was not set with set_capture_seconds or set_num_samples')
+
+            # The trigger is within the capture so a span starting a capture length before it is clamped to the first sample
+            start = self._export_origin(base, -length, format, timeout, export_args)
+            time_span = (start, start + length)
+        elif 'binary' == format:
+            self._export_origin(base, time_span[0], format, timeout, export_args)
+
+        # export_data sends the span with microsecond resolution, the outer edges are rounded outwards
+        edges = np.linspace(time_span[0], time_span[1], shards + 1)
+        edges[0] = np.floor(edges[0] * 1.0e6) / 1.0e6
+        edges[-1] = np.ceil(edges[-1] * 1.0e6) / 1.0e6
+        edges = np.unique(np.round(edges, 6))
+
+        extension = extension or ('.bin' if 'binary' == format else '.csv')
+        names = [f'{base}_shard{i}{extension}' for i in range(len(edges) - 1)]
+
+        pool = ProcessPoolExecutor(max_workers = min(workers, len(names))) if 'csv' == format else None
+        try:
+            parts = []
+            for name, start, end in zip(names, edges[:-1], edges[1:]):
+                self.export_data(name, time_span=(start, end), format=format, timeout=timeout, **export_args)
+                if pool is not None:
+                    parts.append(pool.submit(read_csv, os.path.join(self.datastorage_path, name)))
+                else:
+                    parts.append(self.load_binary(name))
+
+            if pool is not None:
+                parts = [p.result() for p in parts]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        t, words = stitch(parts)
+        del parts   # Release any mapped files before removing them
+
+        if not keep_files:
+            for name in names:
+                filepath = os.path.join(self.datastorage_path, name)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+        return t, LogicCapture(t, words, self.NUM_CHANNELS)
+
+    def _export_origin(self, base, at, format, timeout, export_args):
+        ''' Export the single sample at time at (relative to the trigger, clamped to the capture)
+        and return its time. For format 'binary' the sample is also exported as binary and
+        binary_t0 aligned to it (see align_binary)
+        '''
+        csv_name = f'{base}_origin.csv'
+        bin_name = f'{base}_origin.bin'
+        csv_args = export_args if 'csv' == format else {k : v for k, v in export_args.items() if k in ('digital_channels', 'analog_channels')}
+        try:
+            self.export_data(csv_name, time_span=(at, at), format='csv', timeout=timeout, **csv_args)
+            t, words = read_csv(os.path.join(self.datastorage_path, csv_name))
+            if len(t) == 0:
+                raise ValueError(f'No sample exported at {at} seconds')
+
+            if 'binary' == format:
+                self.export_data(bin_name, time_span=(at, at), format='binary', timeout=timeout, **export_args)
+                self.align_binary(csv_name, bin_name)
+        finally:
+            for name in (csv_name, bin_name):
+                filepath = os.path.join(self.datastorage_path, name)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+        return float(t[0])
+
+    @property
+    def binary_t0(self):
+        ''' Time of sample 0 given to binary exports by load_binary (and so data), 0.0 until set here
+        or by align_binary
+
+        NOTE: binary exports count samples from the start of the capture but CSV exports are relative
+        to the trigger, so with the default of 0.0 the two differ by the trigger time
+        '''
+        return self._binary_t0
+
+    @binary_t0.setter
+    def binary_t0(self, value):
+        self._binary_t0 = float(value)
+
+    def align_binary(self, csv_filename, bin_filename):
+        ''' Set binary_t0 so binary exports get the trigger relative times of CSV exports
+
+        csv_filename, bin_filename : CSV and binary (ALL_TIME) exports of the same capture in datastorage_path,
+        the first row of each is the start of the capture
+
+        Returns binary_t0
+        '''
+        with open(os.path.join(self.datastorage_path, csv_filename), 'rb') as f:
+            row = f.readline()
+            if b'Time' in row or b'Data' in row:
+                row = f.readline()
+        t_csv = float(row.split(b',')[0])
+
+        t_bin, words = self.load_binary(bin_filename, t0 = 0.0)
+        if len(t_bin) == 0:
+            raise ValueError(f'{bin_filename} has no rows')
+
+        self.binary_t0 = t_csv - t_bin[0]
+        return self.binary_t0
+
+    def load_binary(self, filename, each_sample=None, word_size=None, sample_rate=None, t0=None):
+        ''' Memory-map a binary export from datastorage_path (see read_binary)
+
+        each_sample, word_size : layout of the file, None to use the settings of the last export_data(format='binary')
+
+        sample_rate : digital samples per second, None to use the rate last set with set_sample_rate
+
+        t0 : time of sample 0, None for binary_t0
+
+        Returns t, words (bit n of each word is the n-th recorded channel)
+        '''
+        if '\\' in filename or '/' in filename:
+            raise ValueError(f'{filename} must not have path in it (use datastorage_path property)')
+
+        if each_sample is None:
+            each_sample = self._binary_export.get('each_sample', True)
+        if word_size is None:
+            word_size = self._binary_export.get('word_size', 16)
+        if sample_rate is None and self._sample_rate is not None:
+            sample_rate = self._sample_rate[0]
+
+        if t0 is None:
+            t0 = self._binary_t0
+
+        return read_binary(os.path.join(self.datastorage_path, filename), sample_rate, each_sample, word_size, t0)
+
     def data(self, filename, plotit = True, displayit = False):
         ''' Read filename from datastorage_path and return time and data as arrays for processing
         as digital data.
@@ -720,7 +1298,9 @@ class Logic(Base):
 
         t : time values corresponding to each transition point in the data
 
-        data : a list of numpy arrays for each channel recorded.
+        data : a LogicCapture of the packed data words, which behaves like a list of bool
+        arrays for each channel recorded (data[channel]) and also provides find, find_transitions,
+        and is_bounced directly on the packed words
 
         NOTE: The data is extracted from an assumed CSV file exported via export_data. The assumed format
         is a time column and a hex numeric for which the least signficant bit is the lowest numbered
@@ -729,27 +1309,22 @@ class Logic(Base):
 
         NOTE: It is HIGHLY RECOMMENDED to simply make all channels active, record them all and not need
         to worry about which channel number is which bit when few than max channels
+
+        NOTE: A filename ending in .bin is read as a binary export with load_binary (much faster for
+        long captures), otherwise the CSV format above is assumed
         '''
         if '\\' in filename or '/' in filename:
             raise ValueError(f'{filename} must not have path in it (use datastorage_path property)')
 
-        if '.csv' not in filename:
-            filename += '.csv'
+        if filename.endswith('.bin'):
+            t, words = self.load_binary(filename)
+        else:
+            if '.csv' not in filename:
+                filename += '.csv'
+            t, words = read_csv(os.path.join(self.datastorage_path,filename))
 
         filepath = os.path.join(self.datastorage_path,filename)
-
-        t = np.array([])
-        data = self.NUM_CHANNELS*[np.array([], dtype='bool')]
-        with open(filepath, newline = '') as f:
-            reader = csv.reader(f)
-            for rowdata in reader:
-                if 'Time' in rowdata[0] or 'Data' in rowdata[1]:
-                    pass
-                else:
-                    t = np.append(t, float(rowdata[0]))
-                    x = int(rowdata[1], self.NUM_CHANNELS)
-                    for channel in range(self.NUM_CHANNELS):
-                        data[channel] = np.append(data[channel], ((x >> channel) & 1) == True)
+        data = LogicCapture(t, words, self.NUM_CHANNELS)
         
         # Verify that t is always increasing
         dt = np.diff(t)
@@ -761,7 +1336,9 @@ class Logic(Base):
             fig,ax = pl.subplots()
             index = 0
             for d in data:
-                pl.step(t,d + index, where='post')
+                # Decimated for display, glitches and the level after each bucket are kept
+                tt, dd = minmax(t, d.astype(np.int8), keep_last = True)
+                pl.step(tt, dd + index, where='post')
                 index += 2
             
             # Create labels that are active channels for aligning to bottom
@@ -774,7 +1351,7 @@ class Logic(Base):
             pl.xlabel('Time (seconds)')
             pl.ylabel('Active Channel Index')
 
-            figfilepath = filepath.replace('.csv','.png')
+            figfilepath = os.path.splitext(filepath)[0] + '.png'
             print(f'[INFO] Figure saved to {figfilepath}')
             pl.savefig(figfilepath)
 
@@ -792,18 +1369,29 @@ class Logic(Base):
 
         return t, data
 
-    def simulate_data(self,filename,t,data):
+    def simulate_data(self,filename,t,data,format='csv',sample_rate=None):
         ''' creates a user-defined data file that can be recalled using the data() function for plotting
         and analysis. The primary use case is to create data sets that can be used to test analysis logic
+
+        data : list of channel arrays (or a LogicCapture)
+
+        format : 'csv' or 'binary' (ON_CHANGE layout, see load_binary)
+
+        sample_rate : digital samples per second for the binary sample numbers, None to use the
+        rate last set with set_sample_rate
         '''
         if self.simulated:
             if '\\' in filename or '/' in filename:
                 raise ValueError(f'{filename} must not have path in it (use datastorage_path property)')
 
+            if format not in ('csv', 'binary'):
+                raise ValueError("format must be 'csv' or 'binary'")
+
             filename += '_simulated'
 
-            if '.csv' not in filename:
-                filename += '.csv'
+            extension = '.csv' if 'csv' == format else '.bin'
+            if extension not in filename:
+                filename += extension
 
             filepath = os.path.join(self.datastorage_path,filename)
 
@@ -823,22 +1411,29 @@ class Logic(Base):
             if len(index_dt_wrong) > 0:
                 raise ValueError(f't must be always increasing: invalid value found near index {index_dt_wrong + 1}')
             
-            with open(filepath, mode='w', newline = '') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Time (s)'] + ['Data (hex)'])
-                
-                # Assemble hex data for each row
-                index = 0
-                for trow in t:
-                    combined_data = 0
-                    channel = 0
-                    for d in data:
-                        combined_data |= ((d[index] & 1) << channel)
-                        channel += 1
-                    
-                    index += 1
-
-                    writer.writerow([trow] + [hex(combined_data)[2:]])           
+            # Pack the channels into words
+            if isinstance(data, LogicCapture):
+                words = data.words
+            else:
+                words = np.zeros(len(t), dtype=np.uint64)
+                for channel, d in enumerate(data):
+                    words |= (np.asarray(d).astype(np.uint64) & np.uint64(1)) << np.uint64(channel)
+
+            if 'csv' == format:
+                write_csv(filepath, t, words, self.NUM_CHANNELS)
+            else:
+                if sample_rate is None and self._sample_rate is not None:
+                    sample_rate = self._sample_rate[0]
+                if not sample_rate:
+                    raise ValueError('sample_rate is required for a binary fixture')
+
+                word_size = max(8, 1 << (self.NUM_CHANNELS - 1).bit_length())
+                write_binary(filepath, t, words, sample_rate, word_size, self._binary_t0)
+
+                # So load_binary and data() read the fixture back with the same layout
+                self._binary_export = {'each_sample' : False, 'word_size' : word_size}
+                if self._sample_rate is None:
+                    self._sample_rate = (sample_rate, 0)
         else:
             print('[WARNING] simulate_data called while not simulating Logic Analyzer. No data written')
 
@@ -38,6 +38,8 @@ import warnings
 
 
 class Device():
+    RECV_SIZE = 1 << 16     # Bytes requested from the socket per recv
+
     class SaleaeError(Exception):
         pass
 
@@ -134,7 +136,8 @@ class Device():
         self._to_send = []
         self.sample_rates = None
         self.connected_devices = None
-        self._rxbuf = ''
+        self._rxbuf = bytearray()   # Received bytes not yet returned by _recv
+        self._rxscan = 0            # Bytes of _rxbuf already searched for ACK
         self._touched = False
 
         defaulthost = 'localhost'
@@ -215,21 +218,38 @@ class Device():
     def _send(self, s):
         self._touched = True
         log.debug("Send >{}<".format(s))
-        self._s.send(bytes(s + '\0', 'UTF-8'))
+        self._s.sendall(bytes(s + '\0', 'UTF-8'))
 
     def _recv(self, expect_nak=False):
+        '''Return the reply to the oldest outstanding command (the bytes before its ACK)
+
+        Received bytes accumulate in a bytearray and only the newly received part is
+        searched for the ACK, so long replies (e.g., data_response exports) cost linear time
+        '''
         self._touched = True
-        while 'ACK' not in self._rxbuf:
-            self._rxbuf += self._s.recv(1024).decode('UTF-8')
-            log.debug("Recv >{}<".format(self._rxbuf))
-            if 'NAK' == self._rxbuf[0:3]:
-                self._rxbuf = self._rxbuf[3:]
+        while True:
+            if self._rxbuf[0:3] == b'NAK':
+                del self._rxbuf[0:3]
+                self._rxscan = 0
                 if expect_nak:
                     return None
                 else:
                     raise self.CommandNAKedError
-        ret, self._rxbuf = self._rxbuf.split('ACK', 1)
-        return ret
+
+            # Back up so an ACK split across two receives is still found
+            i = self._rxbuf.find(b'ACK', max(0, self._rxscan - 2))
+            if i >= 0:
+                ret = self._rxbuf[0:i].decode('UTF-8')
+                del self._rxbuf[0:i + 3]
+                self._rxscan = 0
+                return ret
+
+            self._rxscan = len(self._rxbuf)
+            chunk = self._s.recv(self.RECV_SIZE)
+            if not chunk:
+                raise ConnectionError('Logic software closed the socket')
+            log.debug("Recv >{}<".format(chunk))
+            self._rxbuf += chunk
 
     def _cmd(self, s, wait_for_ack=True, expect_nak=False):
         self._send(s)
@@ -239,6 +259,29 @@ class Device():
             ret = self._recv(expect_nak=expect_nak)
         return ret
 
+    def _cmd_many(self, commands, expect_nak=False):
+        '''Send several commands back to back, then collect their replies in order
+
+        Saves a round trip per command over calling _cmd for each. With expect_nak a
+        NAKed command yields None, otherwise the first NAK raises CommandNAKedError after
+        the remaining replies have been drained so later commands stay in step
+        '''
+        for s in commands:
+            self._send(s)
+
+        replies = []
+        naked = None
+        for _ in commands:
+            try:
+                replies.append(self._recv(expect_nak=expect_nak))
+            except self.CommandNAKedError as e:
+                replies.append(None)
+                naked = naked or e
+
+        if naked is not None:
+            raise naked
+        return replies
+
     # NOTE: the [EACH_SAMPLE|ON_CHANGE] is the same as the CSV [ROW_PER_CHANGE|ROW_PER_SAMPLE], but I am using name convention from official C# API
     def _export_data2_digital_binary(self, each_sample=True, no_shift=True, word_size=16):
         '''Binary digital: [EACH_SAMPLE|ON_CHANGE], [NO_SHIFT|RIGHT_SHIFT], [8|16|32|64]'''
@@ -0,0 +1,501 @@
+# Stand-in for the Saleae Logic scripting socket server
+# Answers the socket API commands used by saleae.Device and Logic (device selection, channels,
+# sample rates, capture, save/load, and EXPORT_DATA2 to CSV or binary) with synthetic captures,
+# so the logic analyzer path can be tested and benchmarked without the Logic software or hardware
+#
+# Like the Logic software with no hardware attached it reports the four demo devices, so
+# Logic.simulated is True for a Logic connected to it
+#
+# Each capture is a random on-change record: 'transitions' rows, each toggling one active
+# digital channel, spread over the configured capture length (SET_NUM_SAMPLES or
+# SET_CAPTURE_SECONDS at the current sample rate). Only digital data is produced, exports
+# that include analog channels are NAKed.
+#
+#   latency         seconds added before each reply
+#   capture_time    wall clock seconds a capture takes, None for the capture length itself
+#   export_delay    seconds after the EXPORT_DATA2 ACK before the file is written, to mimic
+#                   the Logic software finishing exports in the background
+#   trigger_time    seconds from the start of a capture to its trigger. As with the Logic
+#                   software, CSV times and TIME_SPAN are relative to the trigger while binary
+#                   sample numbers count from the start of the capture
+#
+# NOTE: CAPTURE is not answered (Logic.capture_start does not wait for a reply), completion
+# is polled with IS_PROCESSING_COMPLETE
+#
+# USAGE:  with Simulator(port = 0, transitions = 1000000, capture_time = 0.0) as sim:
+#             la = LogicPro16(vid = USB_VID, pid = LogicPro16.USB_PID, ipaddr = sim.address)
+#             la.capture_start_and_wait_until_finished()
+#             la.export_data('capture.bin', format = 'binary', each_sample = False)
+#             t, data = la.data('capture.bin', plotit = False)
+#
+#         python -m instruments.saleae.simulator --port 10429 --latency 0.001
+
+# Standard
+import argparse
+import collections
+import math
+import os
+import socketserver
+import threading
+import time
+
+# 3rd party
+import numpy as np
+
+# Local
+from instruments.saleae.logic import write_csv, write_binary
+
+class _NAK(Exception):
+    pass
+
+class _Handler(socketserver.BaseRequestHandler):
+    ''' One client connection: NUL terminated commands in, "<reply>ACK" or "NAK" out
+    '''
+    def handle(self):
+        simulator = self.server.simulator
+        buffer = bytearray()
+        while True:
+            try:
+                chunk = self.request.recv(1 << 16)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+
+            i = buffer.find(b'\0')
+            while i >= 0:
+                command = buffer[0:i].decode('UTF-8')
+                del buffer[0:i + 1]
+
+                reply = simulator.reply(command)
+                if reply is not None:
+                    if simulator.latency > 0.0:
+                        time.sleep(simulator.latency)
+                    self.request.sendall(reply)
+
+                i = buffer.find(b'\0')
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class Simulator:
+    ''' Local socket server standing in for the Saleae Logic software
+
+    :port: 10429 is the Logic default, 0 picks a free port (see address)
+
+    :transitions: rows (on-change records) in each synthetic capture
+
+    :seed: for repeatable captures
+    '''
+    DEVICES = ( ('Logic 4',         'LOGIC_4_DEVICE',       0x4a3c, 4),
+                ('Logic 8',         'LOGIC_8_DEVICE',       0x8b27, 8),
+                ('Logic Pro 8',     'LOGIC_PRO_8_DEVICE',   0x8e51, 8),
+                ('Logic Pro 16',    'LOGIC_PRO_16_DEVICE',  0x16d9, 16)
+              )
+    SAMPLE_RATES = (500000000, 250000000, 100000000, 50000000, 25000000, 10000000, 5000000, 2000000, 1000000)
+    PERFORMANCE = (100, 80, 60, 40, 20)
+    PRETRIGGER_SIZES = (1000000, 10000000, 100000000, 1000000000)
+    VOLTAGES = ('1.2 Volts', '1.8 Volts', '3.3+ Volts')
+
+    def __init__(self, host = 'localhost', port = 10429, latency = 0.0, transitions = 10000, capture_time = None, export_delay = 0.0, trigger_time = 0.0, seed = None):
+        self.latency = latency
+        self.transitions = transitions
+        self.capture_time = capture_time
+        self.export_delay = export_delay
+        self.trigger_time = trigger_time
+
+        self.commands = collections.Counter()   # Commands served, by name
+
+        self._host = host
+        self._port = port
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+
+        self.reset()
+
+    def reset(self):
+        ''' Back to the power up state with no capture
+        '''
+        with self._lock:
+            self._select(1)
+            self._performance = 100
+            self._sample_rate = (self.SAMPLE_RATES[2], 0)
+            self._num_samples = None
+            self._capture_seconds = 1.0
+            self._pretrigger = self.PRETRIGGER_SIZES[0]
+            self._voltage = len(self.VOLTAGES) - 1
+            self._clear()
+
+    def _select(self, index):
+        if index not in range(1, len(self.DEVICES) + 1):
+            raise _NAK
+        self._active = index
+        self._digital = list(range(self.DEVICES[index - 1][3]))
+        self._analog = []
+
+    def _clear(self):
+        self._samples = None    # Sample number of each row of the capture
+        self._words = None      # Word of each row, bit n is channel n
+        self._rate = None       # Digital sample rate of the capture
+        self._total = 0         # Samples in the capture
+        self._started = None    # Wall clock time the capture started
+        self._done = None       # Wall clock time the capture completes
+
+    # Server
+
+    def start(self):
+        self._server = _Server((self._host, self._port), _Handler)
+        self._server.simulator = self
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def address(self):
+        ''' 'host:port' for the ipaddr argument of Logic
+        '''
+        port = self._port if self._server is None else self._server.server_address[1]
+        return f'{self._host}:{port}'
+
+    def reply(self, command):
+        ''' bytes to send for one command, None if the command is not answered
+        '''
+        args = [a.strip() for a in command.split(',')]
+        name = args.pop(0).upper()
+        self.commands[name] += 1
+
+        handler = getattr(self, '_on_' + name.lower(), None)
+        with self._lock:
+            try:
+                if handler is None:
+                    raise _NAK
+                reply = handler(args)
+            except (_NAK, ValueError, IndexError, OSError):
+                return b'NAK'
+
+        if reply is None:
+            return None
+        return reply.encode('UTF-8') + b'ACK'
+
+    # Devices and settings
+
+    def _on_get_connected_devices(self, args):
+        reply = ''
+        for index, (name, type, id, channels) in enumerate(self.DEVICES, 1):
+            reply += f'{index}, {name}, {type}, 0x{id:x}' + (', ACTIVE' if index == self._active else '') + '\n'
+        return reply
+
+    def _on_select_active_device(self, args):
+        self._select(int(args[0]))
+        return ''
+
+    def _on_get_performance(self, args):
+        return str(self._performance)
+
+    def _on_set_performance(self, args):
+        if int(args[0]) not in self.PERFORMANCE:
+            raise _NAK
+        self._performance = int(args[0])
+        return ''
+
+    def _on_get_all_sample_rates(self, args):
+        return ''.join(f'{rate}, 0\n' for rate in self.SAMPLE_RATES)
+
+    def _on_set_sample_rate(self, args):
+        rate = (int(args[0]), int(args[1]))
+        if rate[0] not in self.SAMPLE_RATES or rate[1] != 0:
+            raise _NAK
+        self._sample_rate = rate
+        return ''
+
+    def _on_get_active_channels(self, args):
+        return ', '.join(['digital_channels'] + [str(ch) for ch in self._digital] + ['analog_channels'] + [str(ch) for ch in self._analog])
+
+    def _on_set_active_channels(self, args):
+        channels = self.DEVICES[self._active - 1][3]
+        digital = []
+        analog = []
+        selected = None
+        for a in args:
+            if 'digital_channels' == a:
+                selected = digital
+            elif 'analog_channels' == a:
+                selected = analog
+            elif selected is None or int(a) not in range(channels):
+                raise _NAK
+            else:
+                selected.append(int(a))
+
+        if len(digital) == 0 and len(analog) == 0:
+            raise _NAK
+        self._digital = sorted(set(digital))
+        self._analog = sorted(set(analog))
+        return ''
+
+    def _on_reset_active_channels(self, args):
+        self._select(self._active)
+        return ''
+
+    def _on_set_num_samples(self, args):
+        self._num_samples = int(args[0])
+        self._capture_seconds = None
+        return ''
+
+    def _on_get_num_samples(self, args):
+        return str(self._capture_samples())
+
+    def _on_set_capture_seconds(self, args):
+        self._capture_seconds = float(args[0])
+        self._num_samples = None
+        return ''
+
+    def _on_get_capture_pretrigger_buffer_size(self, args):
+        return str(self._pretrigger)
+
+    def _on_set_capture_pretrigger_buffer_size(self, args):
+        if int(args[0]) not in self.PRETRIGGER_SIZES:
+            raise _NAK
+        self._pretrigger = int(args[0])
+        return ''
+
+    def _on_get_digital_voltage_options(self, args):
+        return ''.join(f'{i}, {v}, ' + ('SELECTED' if i == self._voltage else 'NOT_SELECTED') + '\n' for i, v in enumerate(self.VOLTAGES))
+
+    def _on_set_digital_voltage_option(self, args):
+        if int(args[0]) not in range(len(self.VOLTAGES)):
+            raise _NAK
+        self._voltage = int(args[0])
+        return ''
+
+    def _on_set_trigger(self, args):
+        return ''
+
+    def _on_get_analyzers(self, args):
+        return ''
+
+    def _on_close_all_tabs(self, args):
+        self._clear()
+        return ''
+
+    # Capture
+
+    def _capture_samples(self):
+        if self._num_samples is not None:
+            return self._num_samples
+        return int(round(self._capture_seconds * self._sample_rate[0]))
+
+    def _capture(self):
+        ''' Make a new synthetic capture
+        '''
+        if len(self._digital) == 0:
+            raise _NAK
+
+        total = max(self._capture_samples(), 1)
+
+        # Row 0 is the initial state (all low), every other row toggles one active channel
+        samples = np.unique(self._rng.integers(1, total, size = min(self.transitions, total - 1), dtype = np.uint64)) if total > 1 else np.zeros(0, dtype = np.uint64)
+        toggles = (np.uint64(1) << np.array(self._digital, dtype = np.uint64))[self._rng.integers(0, len(self._digital), size = len(samples))]
+
+        self._samples = np.concatenate(([np.uint64(0)], samples))
+        self._words = np.bitwise_xor.accumulate(np.concatenate(([np.uint64(0)], toggles)))
+        self._rate = self._sample_rate[0]
+        self._total = total
+
+        duration = total / self._rate if self.capture_time is None else self.capture_time
+        self._started = time.time()
+        self._done = self._started + duration
+
+    def _complete(self):
+        return self._done is None or time.time() >= self._done
+
+    def _on_capture(self, args):
+        self._capture()
+        return None
+
+    def _on_is_processing_complete(self, args):
+        return 'TRUE' if self._complete() else 'FALSE'
+
+    def _on_stop_capture(self, args):
+        if self._complete():
+            raise _NAK
+
+        # Keep what was recorded so far
+        now = time.time()
+        recorded = max(int(self._total * (now - self._started) / (self._done - self._started)), 1)
+        keep = max(np.searchsorted(self._samples, recorded, side = 'left'), 1)
+        self._samples = self._samples[:keep]
+        self._words = self._words[:keep]
+        self._total = recorded
+        self._done = now
+        return ''
+
+    def _on_capture_to_file(self, args):
+        self._capture()
+        time.sleep(max(0.0, self._done - time.time()))
+        return self._on_save_to_file(args)
+
+    def _on_save_to_file(self, args):
+        if self._words is None or not self._complete():
+            raise _NAK
+
+        # Not the Logic format, just enough for LOAD_FROM_FILE to restore the capture
+        with open(args[0], 'wb') as f:
+            np.savez(f, samples = self._samples, words = self._words, rate = self._rate, total = self._total)
+        return ''
+
+    def _on_load_from_file(self, args):
+        with np.load(args[0]) as saved:
+            self._samples = saved['samples']
+            self._words = saved['words']
+            self._rate = int(saved['rate'])
+            self._total = int(saved['total'])
+        self._done = None
+        return ''
+
+    # Export
+
+    def _span(self, time_span):
+        ''' Rows within time_span, starting with the state at the start of the span
+        '''
+        if time_span is None:
+            return self._samples, self._words, self._total - 1
+
+        first = min(max(math.ceil((time_span[0] + self.trigger_time) * self._rate), 0), self._total - 1)
+        last = min(max(math.floor((time_span[1] + self.trigger_time) * self._rate), first), self._total - 1)
+
+        i = np.searchsorted(self._samples, first, side = 'right')
+        j = np.searchsorted(self._samples, last, side = 'right')
+
+        samples = np.concatenate(([np.uint64(first)], self._samples[i:j]))
+        words = np.concatenate((self._words[i - 1:i], self._words[i:j]))
+        return samples, words, last
+
+    @staticmethod
+    def _pack(words, channels, shift):
+        ''' Words of the exported channels, bit n is the n-th exported channel when shifted
+        otherwise each channel keeps its own bit
+        '''
+        if not shift:
+            mask = np.uint64(sum(1 << ch for ch in channels))
+            return words & mask
+
+        packed = np.zeros(len(words), dtype = np.uint64)
+        for n, ch in enumerate(channels):
+            packed |= ((words >> np.uint64(ch)) & np.uint64(1)) << np.uint64(n)
+        return packed
+
+    def _on_export_data2(self, args):
+        if self._words is None or not self._complete():
+            raise _NAK
+
+        path = args[0]
+        i = 1
+
+        # Channel selection
+        if 'ALL_CHANNELS' == args[i]:
+            digital = self._digital
+            analog = self._analog
+            i += 1
+        elif 'SPECIFIC_CHANNELS' == args[i]:
+            i += 1
+            if args[i] in ('ANALOG_AND_DIGITAL', 'DIGITAL_ONLY', 'ANALOG_ONLY'):
+                i += 1
+            digital = []
+            analog = []
+            while args[i].endswith(' DIGITAL') or args[i].endswith(' ANALOG'):
+                channel, kind = args[i].split()
+                (digital if 'DIGITAL' == kind else analog).append(int(channel))
+                i += 1
+        else:
+            raise _NAK
+
+        if len(analog) or len(digital) == 0 or not set(digital) <= set(self._digital):
+            raise _NAK
+
+        # Time selection
+        if 'ALL_TIME' == args[i]:
+            time_span = None
+            i += 1
+        elif 'TIME_SPAN' == args[i]:
+            time_span = (float(args[i + 1]), float(args[i + 2]))
+            i += 3
+        else:
+            raise _NAK
+
+        samples, words, last = self._span(time_span)
+        format = args[i].upper()
+        options = [a.upper() for a in args[i + 1:]]
+
+        if 'CSV' == format:
+            headers, delimiter, timestamp, display = options[0:4]
+            if delimiter != 'COMMA' or timestamp != 'TIME_STAMP' or display != 'COMBINED' or options[4] != 'HEX':
+                raise _NAK
+            each_sample = 'ROW_PER_SAMPLE' == options[5]
+            shift = True
+            word_size = 64
+        elif 'BINARY' == format:
+            each_sample = 'EACH_SAMPLE' == options[0]
+            shift = 'RIGHT_SHIFT' == options[1]
+            word_size = int(options[2])
+        else:
+            raise _NAK
+
+        words = self._pack(words, sorted(digital), shift)
+        if word_size < 64 and np.any(words >> np.uint64(word_size)):
+            raise _NAK
+
+        if each_sample:
+            words = np.repeat(words, np.diff(np.concatenate((samples, [np.uint64(last + 1)]))).astype(np.int64))
+            samples = np.arange(int(samples[0]), last + 1, dtype = np.uint64)
+
+        rate = self._rate
+        def write():
+            if 'CSV' == format:
+                write_csv(path, samples / rate - self.trigger_time, words, len(digital), 'HEADERS' == headers)
+            elif each_sample:
+                words.astype(f'<u{word_size // 8}').tofile(path)
+            else:
+                write_binary(path, samples / rate, words, rate, word_size)
+
+        if self.export_delay > 0.0:
+            threading.Timer(self.export_delay, write).start()
+        else:
+            write()
+        return ''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Stand-in for the Saleae Logic scripting socket server')
+    parser.add_argument('--host', default = 'localhost')
+    parser.add_argument('--port', type = int, default = 10429)
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds added before each reply')
+    parser.add_argument('--transitions', type = int, default = 10000, help = 'rows in each synthetic capture')
+    parser.add_argument('--capture-time', type = float, default = None, help = 'wall clock seconds per capture (default: the capture length)')
+    parser.add_argument('--export-delay', type = float, default = 0.0, help = 'seconds after the export ACK before the file is written')
+    parser.add_argument('--trigger-time', type = float, default = 0.0, help = 'seconds from the start of a capture to its trigger')
+    parser.add_argument('--seed', type = int, default = None)
+    a = parser.parse_args()
+
+    simulator = Simulator(a.host, a.port, a.latency, a.transitions, a.capture_time, a.export_delay, a.trigger_time, a.seed).start()
+    print(f'[INFO] Saleae Logic stand-in listening on {simulator.address}')
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -30,6 +30,16 @@ class Device:
 
     :visabackend: (Optional) to change the backend from the local default, useful for simulations
     """
+
+    # Declarative settings used by read_state() and apply()
+    #   name : (query, command, decode, encode)
+    # query and command are format strings of {channel} and {value}
+    # decode converts the query response and encode converts the value for the command (None to use as is)
+    SETTINGS = {}
+
+    # True when the instrument accepts several commands or queries joined by ';' in one message
+    COMPOUND_COMMANDS = True
+
     def __init__(self, vid, pid, sn = None, ipaddr = None, visabackend = None, write_termination='\n', read_termination='\n', query_delay=0.1):
         self._resource = None
         self._inst = None
@@ -318,6 +328,158 @@ class Device:
         
         return None
 
+    def query_many(self, cmds):
+        """ query several settings in one message when the instrument allows it
+
+        :cmds: list of queries, each returning a single response
+
+        :retval: list of response strings (None for any that failed)
+        """
+        if len(cmds) == 0:
+            return []
+
+        if self.COMPOUND_COMMANDS:
+            ret = self.query(';'.join(cmds))
+            if ret is not None:
+                values = ret.split(';')
+                if len(values) == len(cmds):
+                    return values
+
+            # Responses that cannot be split unambiguously are asked for one at a time
+
+        return [self.query(cmd) for cmd in cmds]
+
+    def command_many(self, cmds):
+        """ send several commands in one message when the instrument allows it
+        """
+        if len(cmds) == 0:
+            return
+
+        if self.COMPOUND_COMMANDS:
+            self.command(';'.join(cmds))
+        else:
+            for cmd in cmds:
+                self.command(cmd)
+
+    def _settings(self, state):
+        """ Flatten a state dictionary into (channel, name, value) using None for global settings
+        """
+        if not isinstance(state, dict):
+            raise TypeError('state must be a dictionary of setting : value and channel : {setting : value}')
+
+        items = []
+        for key in state:
+            if isinstance(key, int):
+                if not isinstance(state[key], dict):
+                    raise TypeError(f'channel {key} settings must be a dictionary of setting : value')
+                items += [(key, name, state[key][name]) for name in state[key]]
+            else:
+                items.append((None, key, state[key]))
+
+        for channel, name, value in items:
+            if name not in self.SETTINGS:
+                raise ValueError(f'{name} is not a setting of {type(self).__name__}: must be one of {tuple(self.SETTINGS)}')
+
+        return items
+
+    def read_state(self, state):
+        """ Read the current value of every setting named in state with as few transactions as possible
+
+        :state: dictionary of setting : value (global) and channel : {setting : value}, values are ignored
+
+        :retval: dictionary of the same shape with the current values (None if not readable)
+        """
+        items = self._settings(state)
+        responses = self.query_many([self.SETTINGS[name][0].format(channel = channel) for channel, name, _ in items])
+
+        result = {}
+        for (channel, name, _), response in zip(items, responses):
+            decode = self.SETTINGS[name][2]
+            try:
+                value = response if decode is None else decode(response)
+            except (KeyError, TypeError, ValueError):
+                value = None
+
+            if channel is None:
+                result[name] = value
+            else:
+                result.setdefault(channel, {})[name] = value
+
+        return result
+
+    def apply(self, state):
+        """ Bring the instrument to a desired state, writing only the settings that differ
+        from the current state in a single batch
+
+        Re-applying a state that is already in effect costs one bulk query and no writes
+
+        :state: dictionary of setting : value (global) and channel : {setting : value}
+        using names in SETTINGS, e.g., {'horizontal_scale' : 1e-3, 1 : {'vertical_scale' : 0.5}}
+
+        :retval: dictionary of the same shape with only the settings that were written
+        """
+        items = self._settings(state)
+        current = self.read_state(state)
+
+        written = {}
+        cmds = []
+        for channel, name, value in items:
+            now = current[name] if channel is None else current[channel][name]
+            if self._same_setting(now, value):
+                continue
+
+            self._check_setting(channel, name, value)
+
+            encode = self.SETTINGS[name][3]
+            cmds.append(self.SETTINGS[name][1].format(channel = channel, value = value if encode is None else encode(value)))
+
+            if channel is None:
+                written[name] = value
+            else:
+                written.setdefault(channel, {})[name] = value
+
+        self.command_many(cmds)
+
+        if len(written):
+            self._applied(written)
+
+        return written
+
+    def _same_setting(self, current, value):
+        if isinstance(current, (int, float)) and isinstance(value, (int, float)):
+            return abs(current - value) <= 1e-6 * max(abs(current), abs(value)) + 1e-15
+        if isinstance(current, (tuple, list)) and isinstance(value, (tuple, list)):
+            return len(current) == len(value) and all(self._same_setting(c, v) for c, v in zip(current, value))
+        if isinstance(current, str) and isinstance(value, str):
+            return current.upper() == value.upper()
+        return current == value
+
+    def _check_setting(self, channel, name, value):
+        """ Validate a setting before apply() writes it, raise to refuse (derived classes)
+        """
+        pass
+
+    def _applied(self, written):
+        """ Called by apply() after settings were written (derived classes)
+        """
+        pass
+
+    def command_binary(self, cmd, values):
+        """ command (write) helper for commands followed by a binary block (e.g., setup transfer)
+
+        :values: bytes or sequence of byte values written as an IEEE 488.2 definite length block after cmd
+
+        :retval: None if unsuccessful in writing command, otherwise the number of byte written
+        """
+        self._touched = True
+        self.verbose_print(f'{cmd} <{len(values)} bytes>')
+        if self._id:
+            result = self._inst.write_binary_values(cmd, list(values), datatype='B')
+            time.sleep(self._query_delay)
+            return result
+
+        return None
+
     @property
     def simulated(self):
         if self._visabackend is not None:
@@ -26,6 +26,12 @@ class SPD3303X(PowerSupply):
     MAX_CURRENT = 3.2
     SUPPORTS_CHANNEL_COUPLING = True
 
+    # See Device.apply(), this supply only takes one command per message
+    COMPOUND_COMMANDS = False
+    SETTINGS = {    'volt_setpoint'     : ('CH{channel}:VOLTage?', 'CH{channel}:VOLTage {value}', float, None),
+                    'current_setpoint'  : ('CH{channel}:CURRent?', 'CH{channel}:CURRent {value}', float, None)
+               }
+
     def __init__(self,*args, **kwargs):
         super(SPD3303X, self).__init__(*args, **kwargs)
 
@@ -0,0 +1,200 @@
+# Host-side spectral analysis of captured waveforms (e.g., the v,t output of data())
+# Uses numpy only and works through deep records in chunks, so a full-memory capture
+# (memory-mapped or not) is never copied to float64 all at once
+#
+#   spectrum()      windowed real FFT, single-sided amplitude (V peak)
+#   welch()         Welch averaged power spectral density (V^2/Hz)
+#   find_peaks()    largest local maxima of a spectrum
+#   metrics()       THD, SNR, SINAD, SFDR and ENOB of a single tone
+
+# Standard
+from math import nan
+
+# 3rd party
+import numpy as np
+
+# Local
+
+CHUNK_POINTS = 1 << 20  # Samples converted and transformed at a time
+
+# Bins each side of a tone occupied by the window main lobe
+_LOBE = {   'rect'      : 1,
+            'hann'      : 2,
+            'hamming'   : 2,
+            'blackman'  : 3,
+            'flattop'   : 5
+        }
+
+def window(name, n):
+    ''' Returns the named window of length n: rect, hann, hamming, blackman, or flattop
+    '''
+    if name not in _LOBE:
+        raise ValueError(f'window must be one of {tuple(_LOBE)}')
+
+    if 'rect' == name:
+        return np.ones(n)
+    elif 'hann' == name:
+        return np.hanning(n)
+    elif 'hamming' == name:
+        return np.hamming(n)
+    elif 'blackman' == name:
+        return np.blackman(n)
+    else:
+        a = (0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368)
+        x = 2.0 * np.pi * np.arange(n) / (n - 1)
+        return a[0] - a[1] * np.cos(x) + a[2] * np.cos(2 * x) - a[3] * np.cos(3 * x) + a[4] * np.cos(4 * x)
+
+def _xincr(t):
+    if len(t) < 2:
+        raise ValueError('t must have at least 2 points')
+    return float(t[1] - t[0])
+
+def spectrum(v, t, window_name = 'hann'):
+    ''' Windowed real FFT of the whole record
+
+    :return: f (Hz), amplitude (single-sided, peak units of v, corrected for the window gain)
+
+    NOTE: the whole record is transformed at once, use welch() for deep records
+    '''
+    xincr = _xincr(t)
+    w = window(window_name, len(v))
+    x = np.fft.rfft((np.asarray(v, dtype = np.float64) - np.mean(v)) * w)
+
+    amplitude = np.abs(x) / np.sum(w)
+    amplitude[1:] *= 2.0
+    if len(v) % 2 == 0:
+        amplitude[-1] /= 2.0   # Nyquist is not doubled
+
+    return np.fft.rfftfreq(len(v), xincr), amplitude
+
+def welch(v, t, nperseg = 65536, overlap = 0.5, window_name = 'hann'):
+    ''' Welch power spectral density averaged over overlapping segments
+
+    :nperseg: points per segment, sets the resolution bandwidth (fs / nperseg)
+
+    :overlap: fraction of a segment shared with the next (0 <= overlap < 1)
+
+    :return: f (Hz), psd (single-sided, units of v squared per Hz)
+    '''
+    xincr = _xincr(t)
+    n = len(v)
+    nperseg = min(int(nperseg), n)
+    if nperseg < 2:
+        raise ValueError('nperseg must be at least 2')
+
+    if not 0.0 <= overlap < 1.0:
+        raise ValueError('overlap must be 0 <= overlap < 1')
+
+    step = max(1, int(nperseg * (1.0 - overlap)))
+    starts = np.arange(0, n - nperseg + 1, step)
+    batch = max(1, CHUNK_POINTS // nperseg)
+
+    w = window(window_name, nperseg)
+    total = np.zeros(nperseg // 2 + 1)
+    for i in range(0, len(starts), batch):
+        s = starts[i:i + batch]
+        x = np.asarray(v[s[0]:s[-1] + nperseg], dtype = np.float64)
+        segments = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::step]
+        segments = (segments - segments.mean(axis = 1, keepdims = True)) * w
+        total += np.sum(np.abs(np.fft.rfft(segments, axis = 1)) ** 2, axis = 0)
+
+    fs = 1.0 / xincr
+    psd = total / (len(starts) * fs * np.sum(w ** 2))
+    psd[1:] *= 2.0
+    if nperseg % 2 == 0:
+        psd[-1] /= 2.0   # Nyquist is not doubled
+
+    return np.fft.rfftfreq(nperseg, xincr), psd
+
+def find_peaks(f, p, n = 5, min_separation_hz = 0.0, threshold = None):
+    ''' Find the n largest local maxima of spectrum p
+
+    :min_separation_hz: peaks closer than this to a larger peak are ignored
+
+    :threshold: ignore peaks below this value
+
+    :return: f, p of the peaks, largest first
+    '''
+    f = np.asarray(f)
+    p = np.asarray(p)
+
+    candidates = np.flatnonzero((p[1:-1] > p[:-2]) & (p[1:-1] >= p[2:])) + 1
+    if threshold is not None:
+        candidates = candidates[p[candidates] >= threshold]
+    candidates = candidates[np.argsort(p[candidates])[::-1]]
+
+    peaks = []
+    for i in candidates:
+        if len(peaks) >= n:
+            break
+        if all(abs(f[i] - f[j]) >= min_separation_hz for j in peaks):
+            peaks.append(i)
+
+    return f[peaks], p[peaks]
+
+def _band(psd, center, lobe):
+    lo = max(0, center - lobe)
+    hi = min(len(psd), center + lobe + 1)
+    return lo, hi
+
+def metrics(v, t, harmonics = 6, fundamental_hz = None, nperseg = 65536, window_name = 'blackman'):
+    ''' Single tone figures of merit from the Welch spectrum
+
+    :harmonics: number of harmonics (2nd, 3rd, ...) counted as distortion
+
+    :fundamental_hz: tone frequency, None to use the largest non-DC peak
+
+    :return: dictionary with fundamental_hz, fundamental_vrms, thd_percent, thd_db,
+    snr_db, sinad_db, sfdr_db, enob
+    '''
+    f, psd = welch(v, t, nperseg = nperseg, window_name = window_name)
+    df = f[1] - f[0]
+    fs = 1.0 / _xincr(t)
+    lobe = _LOBE[window_name]
+
+    power = psd * df
+    used = np.zeros(len(power), dtype = bool)
+    used[:lobe + 1] = True  # DC
+
+    if fundamental_hz is None:
+        k = lobe + 1 + int(np.argmax(power[lobe + 1:]))
+    else:
+        k = int(round(fundamental_hz / df))
+    lo, hi = _band(power, k, lobe)
+    k = lo + int(np.argmax(power[lo:hi]))   # Refine to the actual peak
+    lo, hi = _band(power, k, lobe)
+    fundamental = np.sum(power[lo:hi])
+    used[lo:hi] = True
+
+    distortion = 0.0
+    for h in range(2, harmonics + 2):
+        fh = (h * f[k]) % fs
+        if fh > fs / 2.0:
+            fh = fs - fh    # Aliased back into the first Nyquist zone
+        lo, hi = _band(power, int(round(fh / df)), lobe)
+        distortion += np.sum(power[lo:hi][~used[lo:hi]])
+        used[lo:hi] = True
+
+    noise = np.sum(power[~used])
+
+    # Largest spur is the largest band outside the fundamental and DC
+    spur = power.copy()
+    spur[:lobe + 1] = 0.0
+    lo, hi = _band(power, k, lobe)
+    spur[lo:hi] = 0.0
+    spur = np.max(np.convolve(spur, np.ones(2 * lobe + 1), mode = 'same'))
+
+    def db(x, y):
+        return 10.0 * np.log10(x / y) if x > 0 and y > 0 else nan
+
+    sinad = db(fundamental, noise + distortion)
+
+    return {    'fundamental_hz'    : float(f[k]),
+                'fundamental_vrms'  : float(np.sqrt(fundamental)),
+                'thd_percent'       : float(100.0 * np.sqrt(distortion / fundamental)) if fundamental > 0 else nan,
+                'thd_db'            : float(db(distortion, fundamental)),
+                'snr_db'            : float(db(fundamental, noise)),
+                'sinad_db'          : float(sinad),
+                'sfdr_db'           : float(db(fundamental, spur)),
+                'enob'              : float((sinad - 1.76) / 6.02)
+           }
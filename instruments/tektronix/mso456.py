@@ -6,9 +6,9 @@
 #   https://forum.tek.com/viewtopic.php?f=580&t=133570
 
 # Standard
+from datetime import datetime
 from math import nan
 import numpy as np
-from struct import unpack
 import os
 import time
 
@@ -16,6 +16,7 @@ import time
 
 # Local
 from ..oscope import Oscilloscope
+from .. import wavestore
 
 # NOTE: Read the section on Synchronization Methods (~page 1455), including example of a sequence a few pages in (1457)
 
@@ -70,6 +71,8 @@ measuredict = { Oscilloscope.Measurements.V_MAX           : "MAXimum",
                 Oscilloscope.Measurements.V_AMPLITUDE     : "AMPLITUDE",
                 Oscilloscope.Measurements.V_AVG           : "MEAN",
                 Oscilloscope.Measurements.V_RMS           : "RMS",
+                Oscilloscope.Measurements.TIME_V_MAX      : "TIMETOMAX",
+                Oscilloscope.Measurements.TIME_V_MIN      : "TIMETOMIN",
                 Oscilloscope.Measurements.OVERSHOOT       : "POVERSHOOT",
                 Oscilloscope.Measurements.PRESHOOT        : "NOVershoot",
                 Oscilloscope.Measurements.AREA            : "AREA",
@@ -84,6 +87,8 @@ measuredict = { Oscilloscope.Measurements.V_MAX           : "MAXimum",
                 Oscilloscope.Measurements.POSITIVE_SLEW   : "RISESLEWRATE",
                 Oscilloscope.Measurements.NEGATIVE_SLEW   : "FALLSLEWRATE"
               }
+# NOTE: V_UPPER, V_MIDDLE, V_LOWER (reference levels), PERIOD_AREA, and VARIANCE have no
+# measurement type on this scope, see Oscilloscope.host_measure
 mathopdict = {  None                                        : None,
                 Oscilloscope.MathOperators.ADD              : "ADD",
                 "ADD"                                       : Oscilloscope.MathOperators.ADD,
@@ -111,6 +116,27 @@ triggerdict = { None : None,
                 "SAVE"                                      : Oscilloscope.TriggerStatus.STOPPED
               }
 
+def _decode_probe(response):
+    ''' Probe attenuation from a :CHx:PROBe:SET? response (e.g., "ATTENUATION 10X")
+    '''
+    return float(response.replace('"', '').split(' ')[1].replace('X', ''))
+
+def _decode_timestamps(stamps):
+    ''' Convert FastFrame time stamps (e.g., "02 Mar 2021 13:45:01.123456789012") to seconds relative to the first
+
+    The fractional seconds are kept separately since they carry more digits than a datetime can hold
+    '''
+    result = []
+    for s in stamps:
+        try:
+            day, frac = s.strip().split('.')
+            whole = datetime.strptime(day, '%d %b %Y %H:%M:%S')
+            result.append((whole, float('0.' + frac)))
+        except ValueError:
+            result.append(None)
+
+    first = next((x for x in result if x is not None), None)
+    return np.array([nan if x is None else (x[0] - first[0]).total_seconds() + (x[1] - first[1]) for x in result])
 
 class MSO456(Oscilloscope):
     USB_PID = '0522'
@@ -120,6 +146,14 @@ class MSO456(Oscilloscope):
     MAX_DATA_POINTS = 0 # TODO
     MAX_DATA_BATCH  = 10000 # TODO
 
+    # See Device.apply(), positions use this driver's convention (> 0 is right)
+    SETTINGS = {    'display'             : (':DISplay:WAVEView1:CH{channel}:STATE?', ':DISplay:WAVEView1:CH{channel}:STATE {value}', lambda r: displaydict[r], lambda v: displaydict[v]),
+                    'probe_scale'         : (':CH{channel}:PROBe:SET?', ':CH{channel}:PROBe:SET "ATTENUATION {value}X"', _decode_probe, None),
+                    'vertical_scale'      : (':CH{channel}:SCALe?', ':CH{channel}:SCALe {value}', float, None),
+                    'horizontal_scale'    : (':HORizontal:MODE:SCAle?', ':HORizontal:MODE:SCAle {value}', float, None),
+                    'horizontal_position' : (':HORizontal:DELay:TIMe?', ':HORizontal:DELay:MODe ON;:HORizontal:DELay:TIMe {value}', lambda r: -float(r), lambda v: -v)
+               }
+
     def __init__(self,*args, **kwargs):
         super(MSO456, self).__init__(*args, **kwargs)
 
@@ -129,6 +163,16 @@ class MSO456(Oscilloscope):
         # the default ASCII codec
         self._inst.encoding = 'utf-8'
 
+        # Waveform transfer state negotiated by data()
+        # The preamble is cached per (source, encoding, record length, horizontal scale) until a
+        # vertical or encoding setting is changed through this driver (see invalidate_waveform_cache)
+        self._wfm_source = None
+        self._wfm_encoding = None
+        self._wfm_frames = None     # (FRAMESTARt, FRAMESTOP) last sent, see _select_frames
+        self._wfm_cache = {}
+
+        self._measure_slots = None  # (measuretype, statistics) see configure_measurements
+
     # Override reset to ensure that headers are disabled and codec is enforced
     def reset(self, timeout_sec = 10.0):
         super(MSO456, self).reset(timeout_sec)
@@ -139,6 +183,25 @@ class MSO456(Oscilloscope):
         # Disable headers in responses
         self.command(f':HEADer 0')
 
+        # Everything is back at defaults so the waveform format must be negotiated again
+        self.invalidate_waveform_cache()
+
+    def _applied(self, written):
+        # Any of the settings can change the waveform scaling
+        self.invalidate_waveform_cache()
+
+    def invalidate_waveform_cache(self):
+        ''' Forget the negotiated waveform format and cached preambles
+
+        The setters in this driver call this automatically; call it directly if vertical
+        settings were changed some other way (e.g., front panel or raw commands), record
+        length and horizontal scale are checked on every transfer
+        '''
+        self._wfm_source = None
+        self._wfm_encoding = None
+        self._wfm_frames = None
+        self._wfm_cache = {}
+
     def display(self, channel, state = Oscilloscope.DisplayState.QUERY):
         if not isinstance(channel, int):
             raise TypeError('channel must an integer type')
@@ -160,6 +223,7 @@ class MSO456(Oscilloscope):
                 raise TypeError('hdiv_sec must be numeric value')
 
             self.command(f':HORizontal:MODE:SCAle {hdiv_sec}')
+            self.invalidate_waveform_cache()
         else:
             return self.query_float(':HORizontal:MODE:SCAle?')
 
@@ -174,6 +238,7 @@ class MSO456(Oscilloscope):
             # our interface is > 0 for right, so invert
             self.command(f':HORizontal:DELay:MODe ON')
             self.command(f':HORizontal:DELay:TIMe {-offset_sec}')
+            self.invalidate_waveform_cache()
         else:
             return self.query_float(':HORizontal:DELay:TIMe?')
 
@@ -186,6 +251,7 @@ class MSO456(Oscilloscope):
                 raise TypeError('nx must be numeric scale for probe: e.g, 0.1, 1, 10, etc')
 
             self.command(f':CH{channel}:PROBe:SET "ATTENUATION {nx}X"')
+            self.invalidate_waveform_cache()
         else:
             # nx is None right now, a good default for return
             qstr = self.query(f':CH{channel}:PROBe:SET?')
@@ -206,6 +272,7 @@ class MSO456(Oscilloscope):
                 raise TypeError('vdiv must be numeric value')
 
             self.command(f':CH{channel}:SCALe {vdiv}')   # NOTE: is Volts only on Tek?
+            self.invalidate_waveform_cache()
         else:
             return self.query_float(f':CH{channel}:SCALe?')
 
@@ -309,10 +376,7 @@ class MSO456(Oscilloscope):
                 raise TypeError('measuretype must be a value or tuple of Measurements enum')
         else:
             # Default to all that this class currently provides
-            measuretype = []
-            for m in self.Measurements:
-                if m in measuredict:
-                    measuretype.append(m)
+            measuretype = self._supported_measurements()
 
         if not isinstance(n, int):
             raise TypeError('n must an integer type')
@@ -360,6 +424,7 @@ class MSO456(Oscilloscope):
                 scale = s0 + s1
             self.command(f'DISplay:WAVEView1:MATH:MATH1:VERTical:SCAle {scale}')
             self.command(':DISplay:WAVEView1:MATH:MATH1:VERTical:POSition 0.0')
+            self.invalidate_waveform_cache()
 
             self.wait_op_complete()
 
@@ -416,7 +481,98 @@ class MSO456(Oscilloscope):
 
         return result
 
-    def data(self, channel, startstop = (1,1250000), encoding = Oscilloscope.DataEncoding.INT16_LE):
+    def _supported_measurements(self):
+        ''' Every Measurements value this scope can make, with a warning naming the others
+        '''
+        unsupported = [m.name for m in self.Measurements if m not in measuredict]
+        if len(unsupported):
+            print(f'[WARNING] {", ".join(unsupported)} not supported by this oscilloscope (see host_measure)')
+
+        return [m for m in self.Measurements if m in measuredict]
+
+    def configure_measurements(self, channel, measuretype = None, statistics = False):
+        if not isinstance(channel, int):
+            raise TypeError('channel must an integer type')
+
+        if measuretype is None:
+            measuretype = self._supported_measurements()
+        elif isinstance(measuretype, self.Measurements):
+            measuretype = [measuretype]
+        elif not isinstance(measuretype, (tuple, list)):
+            raise TypeError('measuretype must be a value or tuple of Measurements enum')
+
+        for m in measuretype:
+            if m not in measuredict:
+                raise ValueError(f'{m} is not supported by this oscilloscope')
+
+        if not isinstance(statistics, bool):
+            raise TypeError('statistics must be bool')
+
+        # Each measurement gets its own slot, all sent as one compound command
+        cmds = [':MEASUrement:DELETEALL']
+        for i, m in enumerate(measuretype, 1):
+            cmds.append(f':MEASUrement:MEAS{i}:TYPe {measuredict[m]}')
+            cmds.append(f':MEASUrement:MEAS{i}:SOUrce1 CH{channel}')
+        self.command(';'.join(cmds))
+        self.wait_op_complete()
+
+        self._measure_slots = (list(measuretype), statistics)
+
+    def read_measurements(self):
+        if self._measure_slots is None:
+            raise ValueError('configure_measurements must be called before read_measurements')
+
+        measuretype, statistics = self._measure_slots
+
+        # Results for every slot in one compound query, answered in order and ; separated
+        if statistics:
+            stats = ('CURRentacq:MEAN', 'ALLAcqs:MEAN', 'ALLAcqs:STDDev', 'ALLAcqs:MINimum', 'ALLAcqs:MAXimum', 'ALLAcqs:POPUlation')
+        else:
+            stats = ('CURRentacq:MEAN',)
+
+        queries = []
+        for i in range(1, len(measuretype) + 1):
+            for stat in stats:
+                queries.append(f':MEASUrement:MEAS{i}:RESUlts:{stat}?')
+
+        values = self.query(';'.join(queries))
+        values = values.split(';') if values is not None else []
+        values = [self._convert2float(x) for x in values] + (len(queries) - len(values)) * [nan]
+
+        result = {}
+        for i, m in enumerate(measuretype):
+            x = values[i * len(stats):(i + 1) * len(stats)]
+            if statistics:
+                result.update({m : dict(zip(('value', 'mean', 'stddev', 'min', 'max', 'population'), x))})
+            else:
+                result.update({m : x})
+
+        return result
+
+    def data(self, channel, startstop = (1,1250000), encoding = Oscilloscope.DataEncoding.INT16_LE, filename = None):
+        if filename is None:
+            return self.decode_data(self._transfer(channel, startstop, encoding))
+        return self._transfer(channel, startstop, encoding, filename)
+
+    def raw_data(self, channel, startstop = (1,1250000), encoding = Oscilloscope.DataEncoding.INT16_LE):
+        return self._transfer(channel, startstop, encoding)
+
+    def decode_data(self, raw):
+        batches, preamble = raw
+        if len(batches) == 0:
+            return np.array([]), np.array([]), preamble
+
+        result = (np.concatenate(batches) - preamble['yoff']) * preamble['ymult'] + preamble['yorig']
+        t = np.arange(len(result)) * preamble['xincr']
+
+        return result, t, preamble
+
+    def _transfer(self, channel, startstop, encoding, filename = None):
+        ''' Read :CURVe? in batches
+
+        Returns the raw codes of each batch and the preamble (see decode_data), or with filename
+        v, t, preamble of the store the scaled batches were written into
+        '''
         v = self.verbose
         self.verbose = False
 
@@ -448,46 +604,11 @@ class MSO456(Oscilloscope):
         elif not encoding in dataencdict:
             raise ValueError('Unsupported Encoding for this oscilloscope')
 
-        # Select a data source
-        if isinstance(channel,int):
-            self.command(f':DATa:SOUrce CH{channel}')
-            self.query(':DATa:SOUrce?')
-        else:
-            self.command(':DATa:SOUrce MATH1') # Default to a simple 1 math concept TODO more?
-
-        # Select encoding (e.g., ascii or binary various forms, etc)
-        # Select number of bytes per data point (if applicable)
-        # NOTE: the tuple order is ENCdg, BYT_Nr, BYT_Or, BN_Fmt
-
-        self.command(f':DATa:ENCdg {dataencdict[encoding][0]}')
-        self.query(':DATa:ENCdg?')
-        self.command(f':WFMOutpre:BYT_Nr {dataencdict[encoding][1]}')
-        self.query(':WFMOutpre:ENCdg?')
-        self.query(':WFMOutpre:BYT_Nr?')
-        self.query(':WFMOutpre:BN_Fmt?')
-        self.query(':WFMOutpre:BYT_Or?')
+        preamble = self._select_waveform(channel, encoding)
 
-        # Get preamble information if applicable
-        # Tek encodes characters in a way that crashes the default query
-        # So manually write/read_raw and use a decode that works
-        preamble = self.query(':WFMOutpre?')
+        # A single record, even if segmented_data() last read a range of frames
+        self._select_frames(1, 1)
 
-        # Decode the preamble into essential information about the sample
-        if preamble is not None:
-            x = preamble.split(';')
-            preamble = {    'format' : x[0:6],
-                            'type'   : x[6],
-                            'points' : int(x[7]),
-                            'count'  : None,
-                            'xincr'  : float(x[11]),
-                            'xorig'  : float(x[12]),
-                            'xref'   : float(x[13]),
-                            'yincr'  : float(x[15]),
-                            'ymult'  : float(x[15]),
-                            'yorig'  : float(x[17]),
-                            'yref'   : float(x[16]),
-                            'yoff'   : float(x[16])
-                       }
         if self.verbose:
             for key in preamble:
                 print(key, preamble[key])
@@ -500,11 +621,12 @@ class MSO456(Oscilloscope):
         else:
             points = stop - start + 1
 
-        translator = {  Oscilloscope.DataEncoding.INT8     : ('b', 1, 'int8'),
-                        Oscilloscope.DataEncoding.INT16_LE : ('h', 2, 'int16')
-                        }
-
-        result = np.array([],dtype=dataencdict[encoding][3])
+        # Batches are collected and joined once, or written straight into the on-disk store
+        result = []
+        received = 0
+        if filename is not None:
+            filename = os.path.join(self.datastorage_path, filename)
+            store = wavestore.create(filename, points, preamble)
 
         while points > 0:
             print('.',end='')
@@ -525,11 +647,15 @@ class MSO456(Oscilloscope):
                 _result = _result[headerlen:]
 
             if _result is not None:
+                _result = np.frombuffer(_result, dtype=t[3], count=len(_result) // t[1])
                 points -= len(_result)
-                ustr = f'{len(_result) // t[1]}{t[2]}'
-                _result = np.array(unpack(ustr, _result[:t[1]*(len(_result)//t[1])]),dtype=t[3])
-                _result = (_result - preamble['yoff']) * preamble['ymult'] + preamble['yorig']
-                result = np.append(result, _result)
+
+                if filename is None:
+                    result.append(_result)
+                else:
+                    n = min(len(_result), len(store[0]) - received)
+                    store[0][received:received + n] = (_result[:n] - preamble['yoff']) * preamble['ymult'] + preamble['yorig']
+                received += len(_result)
 
                 if len(_result) > 1200:
                     start = start + len(_result)
@@ -542,13 +668,179 @@ class MSO456(Oscilloscope):
         print('')
         self.verbose = v
 
-        if len(result) != 0:
-            t = np.arange(0, preamble['xincr'] * len(result), preamble['xincr'])
-        else:
-            t = np.array([])
+        if filename is None:
+            return result, preamble
+
+        result, t = wavestore.close(filename, *store, received, preamble)
 
         return result, t, preamble
 
+    def _select_waveform(self, channel, encoding):
+        ''' Select the data source and encoding and return a copy of the preamble
+
+        Commands are only sent when they differ from the last transfer and the
+        preamble is reused until the acquisition settings change
+
+        Record length and horizontal scale are read back each time (one short query)
+        so changes made outside this driver still fetch a fresh preamble
+        '''
+        # Select a data source
+        if isinstance(channel,int):
+            source = f'CH{channel}'
+        else:
+            source = 'MATH1' # Default to a simple 1 math concept TODO more?
+
+        if source != self._wfm_source:
+            self.command(f':DATa:SOUrce {source}')
+            self._wfm_source = source
+
+        # Select encoding (e.g., ascii or binary various forms, etc)
+        # Select number of bytes per data point (if applicable)
+        # NOTE: the tuple order is ENCdg, BYT_Nr, unpack type, dtype
+        if encoding != self._wfm_encoding:
+            self.command(f':DATa:ENCdg {dataencdict[encoding][0]}')
+            self.command(f':WFMOutpre:BYT_Nr {dataencdict[encoding][1]}')
+            self._wfm_encoding = encoding
+
+        # Get preamble information if applicable
+        key = (source, encoding, self.query(':HORizontal:RECOrdlength?;:HORizontal:MODE:SCAle?'))
+        preamble = self._wfm_cache.get(key)
+        if preamble is None:
+            preamble = self._decode_preamble(self.query(':WFMOutpre?'))
+            if preamble is not None:
+                self._wfm_cache[key] = preamble
+
+        if preamble is not None:
+            preamble = dict(preamble)   # Caller gets a copy so the cache cannot be altered
+
+        return preamble
+
+    def _select_frames(self, first, last):
+        ''' Select the range of FastFrame frames :CURVe? returns, only sent when it changes
+        '''
+        if (first, last) != self._wfm_frames:
+            self.command(f':DATa:FRAMESTARt {first}')
+            self.command(f':DATa:FRAMESTOP {last}')
+            self._wfm_frames = (first, last)
+
+    def _decode_preamble(self, preamble):
+        ''' Decode the :WFMOutpre? response into essential information about the sample
+        '''
+        if preamble is not None:
+            x = preamble.split(';')
+            preamble = {    'format' : x[0:6],
+                            'type'   : x[6],
+                            'points' : int(x[7]),
+                            'count'  : None,
+                            'xincr'  : float(x[11]),
+                            'xorig'  : float(x[12]),
+                            'xref'   : float(x[13]),
+                            'yincr'  : float(x[15]),
+                            'ymult'  : float(x[15]),
+                            'yorig'  : float(x[17]),
+                            'yref'   : float(x[16]),
+                            'yoff'   : float(x[16])
+                       }
+        return preamble
+
+    def segmented_acquisition(self, frames = None):
+        if frames is None:
+            if displaydict.get(self.query(':HORizontal:FASTframe:STATE?')) is Oscilloscope.DisplayState.ON:
+                return self.query_int(':HORizontal:FASTframe:COUNt?')
+            return 0
+
+        if not isinstance(frames, int):
+            raise TypeError('frames must be an integer type')
+
+        if frames < 0:
+            raise ValueError('frames must be >= 0')
+
+        if frames == 0:
+            self.command(':HORizontal:FASTframe:STATE OFF')
+        else:
+            self.command(':HORizontal:FASTframe:STATE ON')
+            self.command(f':HORizontal:FASTframe:COUNt {frames}')
+
+        # Record length per frame is usually different in FastFrame
+        self.invalidate_waveform_cache()
+
+    def segmented_data(self, channel, frames = None, encoding = Oscilloscope.DataEncoding.INT16_LE):
+        v = self.verbose
+        self.verbose = False
+
+        if not isinstance(channel, int):
+            if not isinstance(channel, str) or 'MATH' != channel:
+                raise TypeError('channel must an integer type or the string "MATH"')
+
+        if not isinstance(encoding, self.DataEncoding):
+            raise TypeError('encoding must be a DataCoding(Enum) value')
+        elif not encoding in dataencdict:
+            raise ValueError('Unsupported Encoding for this oscilloscope')
+
+        acquired = self.query_int(':ACQuire:NUMFRAMESACQuired?')
+        if frames is None:
+            frames = acquired
+        elif not isinstance(frames, int):
+            raise TypeError('frames must be an integer type or None')
+        elif acquired is not None and frames > acquired:
+            print(f'[WARNING] only {acquired} frames acquired: {frames} requested')
+            frames = acquired
+
+        preamble = self._select_waveform(channel, encoding)
+
+        if frames is None or frames < 1 or preamble is None:
+            self.verbose = v
+            return np.empty((0,0)), np.array([]), np.array([]), preamble
+
+        # All frames come back in a single curve, one record after another
+        points = preamble['points']
+        self._select_frames(1, frames)
+        self.command(':DATa:START 1')
+        self.command(f':DATa:STOP {points}')
+
+        t = dataencdict[encoding]
+        result = np.empty((0, points), dtype=np.float64)
+        _result = self.query_raw(':CURVe?')
+        if _result is not None:
+            # Header is #Nxxxx.n (see data())
+            headerlen = 2 + int(_result[1:2].decode('ascii'))
+            _result = np.frombuffer(_result, dtype=t[3], count=(len(_result) - headerlen) // t[1], offset=headerlen)
+            frames = len(_result) // points
+            _result = (_result[:frames * points] - preamble['yoff']) * preamble['ymult'] + preamble['yorig']
+            result = _result.reshape(frames, points)
+
+        # Trigger time of each frame
+        timestamps = np.full(len(result), nan)
+        if len(result):
+            stamps = self.query(f':HORizontal:FASTframe:TIMEStamp:ALL:{self._wfm_source}?')
+            if stamps is not None:
+                stamps = [x for x in stamps.replace('"','').split(',') if len(x.strip())]
+                timestamps[:len(stamps)] = _decode_timestamps(stamps)[:len(result)]
+
+        self.verbose = v
+
+        t = np.arange(points) * preamble['xincr']
+
+        preamble['count'] = len(result)
+
+        return result, t, timestamps, preamble
+
+    # SET? returns the setup as a string of commands (always with headers) that can be sent back as is
+    def _read_setup(self):
+        setup = self.query_raw('SET?')
+        if setup is None:
+            return None
+        return setup.rstrip(b'\r\n')
+
+    def _write_setup(self, setup):
+        self.command(setup.decode('utf-8'))
+        self.wait_op_complete()
+
+        # The setup may change headers and everything negotiated or programmed through this driver
+        self.command(f':HEADer 0')
+        self.invalidate_waveform_cache()
+        self._measure_slots = None
+
     def sample_rate(self):
         """ Return current sample rate in Sa/s
         """
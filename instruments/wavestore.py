@@ -0,0 +1,83 @@
+# On-disk waveform store
+# A waveform is kept as memory-mapped numpy files so records larger than memory can be
+# captured straight to disk (see data(filename = ...)) and analyzed later with load()
+#
+#   <name>.npy      waveform values
+#   <name>.t.npy    time of each value (seconds)
+#   <name>.json     preamble and number of valid points
+#
+# NOTE: Space for the requested number of points is allocated up front and the count of
+# valid points is written to the sidecar when the capture is closed
+
+# Standard
+import json
+import os
+
+# 3rd party
+import numpy as np
+
+# Local
+
+CHUNK_POINTS = 1 << 20  # Points written at a time when filling the time axis
+
+def _paths(filename):
+    base = os.path.splitext(filename)[0] if filename.endswith('.npy') else filename
+    return base + '.npy', base + '.t.npy', base + '.json'
+
+def create(filename, points, preamble, dtype = np.float32):
+    ''' Allocate a store for points values and return the (v, t) memmaps opened for writing
+
+    The time axis is filled from the preamble 'xincr' in chunks so it never needs to be in memory
+    '''
+    vpath, tpath, jpath = _paths(filename)
+    points = int(points)
+
+    v = np.lib.format.open_memmap(vpath, mode = 'w+', dtype = dtype, shape = (points,))
+    t = np.lib.format.open_memmap(tpath, mode = 'w+', dtype = np.float64, shape = (points,))
+
+    xincr = preamble['xincr'] if preamble is not None else 1.0
+    for i in range(0, points, CHUNK_POINTS):
+        j = min(i + CHUNK_POINTS, points)
+        t[i:j] = np.arange(i, j) * xincr
+
+    _write_sidecar(jpath, preamble, 0, dtype)
+
+    return v, t
+
+def close(filename, v, t, count, preamble):
+    ''' Flush a store created by create(), record the number of valid points and
+    return (v, t) trimmed to that count
+    '''
+    count = min(int(count), len(v))
+    v.flush()
+    t.flush()
+    _write_sidecar(_paths(filename)[2], preamble, count, v.dtype)
+
+    return v[:count], t[:count]
+
+def load(filename, mode = 'r', directory = None):
+    ''' Open a stored waveform without reading it into memory
+
+    :mode: 'r' for read only or 'r+' to allow modification in place
+
+    :directory: where filename is, e.g., the datastorage_path data(filename = ...) wrote it to
+    (None for filename as given)
+
+    :return: v, t, preamble like data()
+    '''
+    if directory is not None:
+        filename = os.path.join(directory, filename)
+    vpath, tpath, jpath = _paths(filename)
+
+    with open(jpath) as f:
+        sidecar = json.load(f)
+
+    count = sidecar['count']
+    v = np.load(vpath, mmap_mode = mode)[:count]
+    t = np.load(tpath, mmap_mode = mode)[:count]
+
+    return v, t, sidecar['preamble']
+
+def _write_sidecar(jpath, preamble, count, dtype):
+    with open(jpath, 'w') as f:
+        json.dump({'count' : count, 'dtype' : np.dtype(dtype).name, 'preamble' : preamble}, f, indent = 4)
@@ -0,0 +1,142 @@
+# Multi-channel waveform export
+# Writes several waveforms (e.g., data() output for each channel) against a common time
+# column in large blocks rather than one row at a time
+#
+# Formats:
+#   csv     text with a header row: time, then one column per waveform
+#   npz     numpy archive with t, one array per waveform, and the preambles as JSON
+#   bin     compact binary, see below
+#
+# Binary layout (little endian):
+#   magic      4 bytes  b'PYNW'
+#   version    uint16
+#   header     uint32 length followed by that many bytes of UTF-8 JSON
+#              {"names": [...], "points": n, "dtype": "float32", "time_dtype": "float64", "preambles": {...}}
+#   t          points x time_dtype
+#   waveforms  points x dtype for each name in order
+
+# Standard
+import json
+import os
+import struct
+
+# 3rd party
+import numpy as np
+
+# Local
+
+FORMATS = ('csv', 'npz', 'bin')
+BLOCK_POINTS = 1 << 18  # Rows (points) written per block
+
+MAGIC = b'PYNW'
+VERSION = 1
+
+def _normalize(waveforms):
+    ''' Returns t, names, values, preambles from a dictionary of name : (v, t, preamble) or name : (v, t)
+    '''
+    if not isinstance(waveforms, dict) or len(waveforms) == 0:
+        raise TypeError('waveforms must be a non-empty dictionary of name : (v, t, preamble)')
+
+    names = []
+    values = []
+    preambles = {}
+    t = None
+    for name in waveforms:
+        w = waveforms[name]
+        if not isinstance(w, (tuple, list)) or len(w) not in (2, 3):
+            raise TypeError(f'waveform {name} must be (v, t, preamble) as returned by data()')
+
+        names.append(str(name))
+        values.append(w[0])
+        preambles[str(name)] = w[2] if len(w) == 3 else None
+        if t is None:
+            t = w[1]
+
+    points = min([len(t)] + [len(v) for v in values])
+    if any(len(v) != points for v in values) or len(t) != points:
+        print(f'[WARNING] waveforms differ in length: exporting the first {points} points')
+
+    return t[:points], names, [v[:points] for v in values], preambles
+
+def export(waveforms, filename, format = 'csv', time_label = 't', dtype = np.float32):
+    ''' Write waveforms sharing the time column of the first waveform
+
+    :waveforms: dictionary of name : (v, t, preamble) as returned by data()
+
+    :filename: file to write, the format extension is added if missing
+
+    :format: one of FORMATS
+
+    :time_label: name of the time column (csv header)
+
+    :dtype: value type used by the bin format
+
+    :return: the filename written
+    '''
+    if format not in FORMATS:
+        raise ValueError(f'format must be one of {FORMATS}')
+
+    if os.path.splitext(filename)[1][1:].lower() != format:
+        filename += '.' + format
+
+    t, names, values, preambles = _normalize(waveforms)
+
+    if 'csv' == format:
+        with open(filename, 'w', newline = '') as f:
+            f.write(','.join([time_label] + names) + '\n')
+            fmt = ','.join((1 + len(values)) * ['%.9g'])
+            for i in range(0, len(t), BLOCK_POINTS):
+                j = i + BLOCK_POINTS
+                np.savetxt(f, np.column_stack([t[i:j]] + [v[i:j] for v in values]), fmt = fmt)
+
+    elif 'npz' == format:
+        arrays = dict(zip(names, values))
+        arrays[time_label] = t
+        np.savez(filename, preambles = json.dumps(preambles), **arrays)
+
+    else:
+        header = json.dumps({   'names'      : names,
+                                'points'     : len(t),
+                                'dtype'      : np.dtype(dtype).name,
+                                'time_dtype' : 'float64',
+                                'preambles'  : preambles
+                            }).encode('utf-8')
+        with open(filename, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<HI', VERSION, len(header)))
+            f.write(header)
+            for x, xtype in [(t, np.float64)] + [(v, dtype) for v in values]:
+                for i in range(0, len(x), BLOCK_POINTS):
+                    np.asarray(x[i:i + BLOCK_POINTS], dtype = np.dtype(xtype).newbyteorder('<')).tofile(f)
+
+    return filename
+
+def load(filename, mmap = True):
+    ''' Read a file written by export(format = 'bin')
+
+    :mmap: True to memory-map the arrays rather than read them into memory
+
+    :return: dictionary of name : (v, t, preamble) like the input to export()
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f'{filename} is not a waveform export')
+        version, length = struct.unpack('<HI', f.read(6))
+        if version != VERSION:
+            raise ValueError(f'{filename} has unsupported version {version}')
+        header = json.loads(f.read(length).decode('utf-8'))
+
+    points = header['points']
+    offset = 10 + length
+
+    arrays = []
+    for xtype in [header['time_dtype']] + len(header['names']) * [header['dtype']]:
+        xtype = np.dtype(xtype).newbyteorder('<')
+        if mmap:
+            arrays.append(np.memmap(filename, dtype = xtype, mode = 'r', offset = offset, shape = (points,)))
+        else:
+            arrays.append(np.fromfile(filename, dtype = xtype, count = points, offset = offset))
+        offset += points * xtype.itemsize
+
+    t = arrays[0]
+    return {name : (v, t, header['preambles'][name]) for name, v in zip(header['names'], arrays[1:])}
@@ -0,0 +1,7 @@
+# Make the instruments package importable when pytest is run from any directory
+
+# Standard
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
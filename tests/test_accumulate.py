@@ -0,0 +1,46 @@
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+from instruments.accumulate import Average, Envelope, Persistence
+
+def test_average_envelope():
+    rng = np.random.default_rng(0)
+    frames = rng.normal(size = (50, 1000))
+    avg = Average()
+    env = Envelope()
+    for f in frames:
+        avg.add(f)
+        env.add(f)
+
+    assert np.allclose(avg.mean, frames.mean(axis = 0))
+    assert np.allclose(avg.std, frames.std(axis = 0, ddof = 1))
+    assert np.array_equal(env.max, frames.max(axis = 0))
+    assert np.array_equal(env.min, frames.min(axis = 0))
+
+def test_persistence_counts():
+    v = np.tile(np.linspace(0.0, 0.999, 100), (3, 1))
+    p = Persistence((0.0, 1.0), vbins = 10, columns = 10)
+    p.add(v)
+
+    assert p.hits.shape == (10, 10)
+    assert p.hits.sum() == v.size
+    assert np.array_equal(np.diag(p.hits), np.full(10, 30))
+
+def test_persistence_skips_nan():
+    v = np.array([[0.05, 0.15, np.nan, np.nan], [0.05, 0.15, 0.25, 0.35]])
+    p = Persistence((0.0, 1.0), vbins = 10, columns = None)
+    p.add(v)
+
+    assert p.hits.sum() == 6
+    assert p.hits[0, 2] == 0 and p.hits[2, 2] == 1
+
+def test_persistence_limits_grid(capsys):
+    p = Persistence((0.0, 1.0), vbins = 256, columns = None)
+    p.add(np.zeros(1 << 20))
+
+    assert p.hits.size <= Persistence.MAX_CELLS
+    assert p.hits.sum() == 1 << 20
+    assert 'WARNING' in capsys.readouterr().out
@@ -0,0 +1,34 @@
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+from instruments.decimate import minmax
+
+def _level(t, v, times):
+    ''' Step (where='post') value of t, v at times
+    '''
+    return v[np.searchsorted(t, times, side='right') - 1]
+
+def test_minmax_keeps_peaks():
+    v = np.zeros(100000)
+    v[12345] = 1.0
+    t, d = minmax(np.arange(len(v)), v, pixels = 100)
+    assert len(d) <= 200
+    assert d.max() == 1.0
+
+def test_minmax_keep_last_step_level_after_burst():
+    # On-change rows: an odd length toggle burst (ends low), a long idle period, then another burst
+    t = np.concatenate((np.arange(5.0), 1.0e6 + np.arange(5.0)))
+    v = np.array([0, 1, 0, 1, 0, 1, 0, 1, 0, 1], dtype = np.int8)
+    idle = np.linspace(4.5, 1.0e6 - 0.5, 50)
+
+    # Without the last row of the first bucket the idle period is drawn high
+    tt, dd = minmax(t, v, pixels = 2)
+    assert len(tt) == 4
+    assert np.all(_level(tt, dd, idle) == 1)
+
+    tt, dd = minmax(t, v, pixels = 2, keep_last = True)
+    assert np.array_equal(_level(tt, dd, idle), _level(t, v, idle))
+    assert np.all(_level(tt, dd, idle) == 0)
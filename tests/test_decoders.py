@@ -0,0 +1,63 @@
+# Standard
+
+# 3rd party
+import numpy as np
+
+# Local
+from instruments.decoders import uart, spi, i2c
+from instruments.logiccapture import LogicCapture
+
+def _capture(t, levels):
+    ''' On-change LogicCapture from per-channel levels sampled at t
+    '''
+    words = np.zeros(len(t), dtype = np.uint8)
+    for ch, v in enumerate(levels):
+        words |= (np.asarray(v, dtype = np.uint8) & 1) << ch
+    keep = np.r_[True, words[1:] != words[:-1]]
+    return LogicCapture(t[keep], words[keep], 8)
+
+def test_uart():
+    data = [0x55, 0x00, 0xFF, 0xA3]
+    baud = 115200
+    bits = [1] * 4
+    for d in data:
+        bits += [0] + [(d >> n) & 1 for n in range(8)] + [1, 1]
+    samples = 16
+    t = np.arange(len(bits) * samples) / (baud * samples)
+    result = uart(_capture(t, [np.repeat(bits, samples)]), 0, baud)
+
+    assert list(result['data']) == data
+    assert not result['framing_error'].any()
+
+def test_spi():
+    data = [0x3C, 0x81, 0xFE]
+    clk, mosi, cs = [0, 0], [0, 0], [1, 0]
+    for d in data:
+        for n in range(7, -1, -1):
+            b = (d >> n) & 1
+            clk += [0, 1]
+            mosi += [b, b]
+            cs += [0, 0]
+    clk += [0, 0]
+    mosi += [0, 0]
+    cs += [0, 1]
+    t = np.arange(len(clk)) * 1.0e-6
+    result = spi(_capture(t, [clk, mosi, cs]), clk = 0, mosi = 1, cs = 2)
+
+    assert list(result['mosi']) == data
+
+def test_i2c():
+    # START, address 0x50 write, ACK, data 0xA5, NACK, STOP
+    scl, sda = [1, 1], [1, 0]
+    for byte, ack in ((0xA0, 0), (0xA5, 1)):
+        for b in [(byte >> n) & 1 for n in range(7, -1, -1)] + [ack]:
+            scl += [0, 0, 1, 1]
+            sda += [sda[-1], b, b, b]
+    scl += [0, 0, 1, 1]
+    sda += [sda[-1], 0, 0, 1]
+    t = np.arange(len(scl)) * 1.0e-6
+    result = i2c(_capture(t, [scl, sda]), scl = 0, sda = 1)
+
+    assert list(result['data']) == [0xA0, 0xA5]
+    assert list(result['ack']) == [True, False]
+    assert list(result['address']) == [True, False]
@@ -0,0 +1,46 @@
+# Standard
+
+# 3rd party
+import numpy as np
+import pytest
+
+# Local
+from instruments import eye
+
+def _prbs7(n):
+    state = 0x7F
+    bits = np.zeros(n, dtype = np.int8)
+    for i in range(n):
+        bit = ((state >> 6) ^ (state >> 5)) & 1
+        state = ((state << 1) | bit) & 0x7F
+        bits[i] = bit
+    return bits
+
+def _noisy_prbs(noise, samples_per_ui = 32, n = 2000, seed = 0):
+    bits = _prbs7(n)
+    v = np.repeat(bits.astype(float), samples_per_ui)
+    v = np.convolve(v, np.ones(8) / 8, mode = 'same')   # Finite rise time
+    v += np.random.default_rng(seed).normal(scale = noise, size = len(v))
+    t = np.arange(len(v)) * 1.0e-10
+    return v, t, np.count_nonzero(np.diff(bits))
+
+def test_hysteresis_ignores_noise_at_edges():
+    v, t, transitions = _noisy_prbs(0.05)
+
+    assert len(eye.find_crossings(v, 0.5)) > transitions
+    assert len(eye.find_crossings(v, 0.5, hysteresis = 0.4)) == transitions
+
+def test_hysteresis_across_chunks(monkeypatch):
+    v, t, transitions = _noisy_prbs(0.05)
+    whole = eye.find_crossings(v, 0.5, hysteresis = 0.4)
+
+    monkeypatch.setattr(eye, 'CHUNK_POINTS', 1000)
+    assert np.allclose(eye.find_crossings(v, 0.5, hysteresis = 0.4), whole)
+
+def test_eye_jitter_with_hysteresis():
+    v, t, transitions = _noisy_prbs(0.05)
+    result = eye.eye(v, t, bit_rate = 1.0 / 3.2e-9, level = 0.5, hysteresis = 0.4)
+
+    assert result['ui_sec'] == pytest.approx(3.2e-9, rel = 1e-3)
+    assert len(result['tie_sec']) == transitions
+    assert result['tie_rms_sec'] < 0.1 * result['ui_sec']
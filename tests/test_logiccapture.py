@@ -0,0 +1,59 @@
+# Standard
+
+# 3rd party
+import numpy as np
+import pytest
+
+# Local
+from instruments.logiccapture import LogicCapture
+
+def _capture():
+    t = np.arange(8) * 1.0e-6
+    words = np.array([0x0, 0x1, 0x3, 0x2, 0x6, 0x4, 0xC, 0x8])
+    channels = [((words >> ch) & 1).astype(bool) for ch in range(4)]
+    return LogicCapture(t, words, 4), channels
+
+def test_channels_like_a_list():
+    capture, channels = _capture()
+    assert len(capture) == 4
+    for ch in range(4):
+        assert np.array_equal(capture[ch], channels[ch])
+    assert np.array_equal(capture[-1], channels[3])
+    assert all(np.array_equal(a, b) for a, b in zip(capture, channels))
+
+@pytest.mark.parametrize('key', [slice(0, 2), slice(1, None), slice(None, None, -1), slice(-3, -1), slice(0, 10, 2), slice(5, 9)])
+def test_slices(key):
+    capture, channels = _capture()
+    sliced = capture[key]
+    assert isinstance(sliced, list)
+    assert len(sliced) == len(channels[key])
+    assert all(np.array_equal(a, b) for a, b in zip(sliced, channels[key]))
+
+def test_bad_channel():
+    capture, channels = _capture()
+    with pytest.raises(IndexError):
+        capture[4]
+    with pytest.raises(TypeError):
+        capture['0']
+
+def test_transitions():
+    capture, channels = _capture()
+    assert np.array_equal(capture.find_transitions(0), np.flatnonzero(np.diff(channels[0])) + 1)
+    assert np.array_equal(capture.find(1, 1), np.flatnonzero(channels[1]))
+
+def test_transition_index():
+    # 1 MHz square wave at 25% duty on channel 0, one row per edge
+    t = np.arange(40) * 0.25e-6
+    level = (np.arange(40) % 4) == 0
+    rows = np.flatnonzero(np.r_[True, level[1:] != level[:-1]])
+    capture = LogicCapture(t[rows], level[rows].astype(np.uint8), 1)
+    ix = capture.index(0)
+
+    assert ix is capture.index(0)
+    assert ix.count(edge = 'rising') == 9
+    assert ix.next_edge(0.0, 'falling') == pytest.approx(0.25e-6)
+    assert ix.level(0.1e-6) and not ix.level(0.3e-6)
+    assert np.allclose(ix.pulse_widths(1), 0.25e-6)
+    assert ix.period()['mean'] == pytest.approx(1.0e-6)
+    assert ix.duty()['mean'] == pytest.approx(25.0)
+    assert len(ix.edges(1.0e-6, 2.0e-6)) == 3
@@ -0,0 +1,40 @@
+# Standard
+
+# 3rd party
+import numpy as np
+import pytest
+
+# Local
+from instruments.measurements import M, crossings, measure
+
+def _trapezoid(cycles = 5, samples = 400, base = 20, top = 220):
+    ''' Square wave with linear 40 sample edges, as integer codes
+    '''
+    ramp = np.linspace(0.0, 1.0, 40, endpoint = False)
+    cycle = np.concatenate((np.zeros(160), ramp, np.ones(160), ramp[::-1]))
+    v = np.rint(base + (top - base) * np.tile(cycle, cycles))
+    t = np.arange(len(v)) * 1.0e-7
+    return v, t
+
+def test_crossings_of_integer_codes():
+    v = np.array([10, 200, 10], dtype = np.uint8)
+
+    position, rising = crossings(v, 105)
+    assert np.allclose(position, [0.5, 1.5])
+    assert list(rising) == [True, False]
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16])
+def test_measure_integer_codes_match_float(dtype):
+    v, t = _trapezoid()
+
+    expected = measure(v, t)
+    result = measure(v.astype(dtype), t)
+    for m in M:
+        assert result[m] == pytest.approx(expected[m], nan_ok = True), m
+
+def test_fall_time_of_uint8_codes():
+    v, t = _trapezoid()
+
+    result = measure(v.astype(np.uint8), t, [M.RISE_TIME, M.FALL_TIME])
+    assert result[M.FALL_TIME][0] == pytest.approx(result[M.RISE_TIME][0])
+    assert result[M.FALL_TIME][0] == pytest.approx(32 * 1.0e-7, rel = 0.05)
@@ -0,0 +1,174 @@
+# Standard
+import threading
+
+# 3rd party
+import numpy as np
+import pytest
+
+# Local
+from instruments.accumulate import Average, fold
+from instruments.oscope import Oscilloscope
+from instruments.tektronix.mso456 import MSO456
+
+M = Oscilloscope.Measurements
+
+class FakeMSO456(MSO456):
+    ''' MSO456 answering from a small model of the scope instead of a VISA session
+
+    Each acquired frame holds the record index 0 .. record length - 1 as INT16 counts
+    '''
+    def __init__(self, record_length = 1000, frames = 4):
+        self._verbose = False
+        self._wfm_source = None
+        self._wfm_encoding = None
+        self._wfm_frames = None
+        self._wfm_cache = {}
+        self._measure_slots = None
+
+        self.sent = []
+        self.setup = b':HEADER 1;:HORIZONTAL:RECORDLENGTH 1000\n'
+        self.scope = {  ':HORIZONTAL:RECORDLENGTH' : str(record_length),
+                        ':HORIZONTAL:MODE:SCALE'   : '1.0E-6',
+                        ':ACQUIRE:NUMFRAMESACQUIRED' : str(frames),
+                        ':DATA:FRAMESTART' : '1',
+                        ':DATA:FRAMESTOP'  : '1',
+                        ':DATA:START' : '1',
+                        ':DATA:STOP'  : '1'
+                     }
+
+    def command(self, cmd):
+        self.sent.append(cmd)
+        header, value = cmd.split(' ', 1)
+        self.scope[header.upper()] = value
+
+    def query(self, cmd):
+        self.sent.append(cmd)
+        if cmd == ':WFMOutpre?':
+            points = self.scope[':HORIZONTAL:RECORDLENGTH']
+            xincr = float(self.scope[':HORIZONTAL:MODE:SCALE']) * 10 / int(points)
+            return ';'.join(['2', '16', 'BINARY', 'RI', 'LSB', '"Ch1"', 'Y', points,
+                             '"s"', '"V"', 'LINEAR', str(xincr), '0.0', '0', '"V"', '1.0E-3', '0.0', '0.0'])
+        values = [self.scope.get(q.rstrip('?').upper()) for q in cmd.split(';')]
+        return None if None in values else ';'.join(values)    # Like scpi.Device on a failed query
+
+    def query_raw(self, cmd):
+        self.sent.append(cmd)
+        if cmd == 'SET?':
+            return self.setup
+        record = int(self.scope[':HORIZONTAL:RECORDLENGTH'])
+        frames = int(self.scope[':DATA:FRAMESTOP']) - int(self.scope[':DATA:FRAMESTART']) + 1
+        start = int(self.scope[':DATA:START']) - 1
+        stop = min(int(self.scope[':DATA:STOP']), record)
+        data = np.tile(np.arange(start, stop, dtype = '<i2'), frames).tobytes()
+        size = str(len(data))
+        return f'#{len(size)}{size}'.encode('ascii') + data
+
+def test_data_after_segmented_data_reads_one_frame():
+    scope = FakeMSO456(record_length = 1000, frames = 4)
+
+    v, t, timestamps, preamble = scope.segmented_data(1)
+    assert v.shape == (4, 1000)
+
+    v, t, preamble = scope.data(1, startstop = None)
+    assert len(v) == 1000
+    assert np.allclose(v, np.arange(1000) * 1.0e-3)
+
+def test_frame_range_only_sent_when_changed():
+    scope = FakeMSO456()
+
+    scope.data(1, startstop = None)
+    scope.data(1, startstop = None)
+    assert sum(cmd.startswith(':DATa:FRAMESTOP') for cmd in scope.sent) == 1
+
+    scope.invalidate_waveform_cache()
+    scope.data(1, startstop = None)
+    assert sum(cmd.startswith(':DATa:FRAMESTOP') for cmd in scope.sent) == 2
+
+def test_preamble_follows_outside_record_length_change():
+    scope = FakeMSO456(record_length = 1000)
+
+    v, t, preamble = scope.data(1, startstop = None)
+    assert preamble['points'] == 1000
+
+    scope.scope[':HORIZONTAL:RECORDLENGTH'] = '2000'    # Front panel
+    v, t, preamble = scope.data(1, startstop = None)
+    assert preamble['points'] == 2000
+    assert len(v) == 2000
+    assert t[-1] == pytest.approx(1999 * 1.0e-5 / 2000)
+
+def test_preamble_follows_outside_horizontal_scale_change():
+    scope = FakeMSO456(record_length = 1000)
+
+    v, t, preamble = scope.data(1, startstop = None)
+    scope.command(':HORizontal:MODE:SCAle 2.0E-6')      # Raw command, not horizontal_scale()
+    v, t, preamble = scope.data(1, startstop = None)
+    assert preamble['xincr'] == pytest.approx(2.0e-5 / 1000)
+
+def test_preamble_cached_while_settings_unchanged():
+    scope = FakeMSO456()
+
+    scope.data(1, startstop = None)
+    scope.data(1, startstop = None)
+    assert scope.sent.count(':WFMOutpre?') == 1
+
+def test_acquire_loop_decodes_on_worker_and_skips_timeouts():
+    scope = FakeMSO456(record_length = 1000)
+    status = iter([scope.TriggerStatus.TRIGGERED, scope.TriggerStatus.WAITING, scope.TriggerStatus.TRIGGERED])
+    scope.run = lambda trigsweep: None
+    scope.stop = lambda: None
+    scope.wait_for_trigger_status = lambda trigger_status, timeout_sec: next(status)
+
+    decoded_on = []
+    decode_data = scope.decode_data
+    def decode(raw):
+        decoded_on.append(threading.current_thread())
+        return decode_data(raw)
+    scope.decode_data = decode
+
+    received = []
+    stats = scope.acquire_loop(3, 1, lambda k, captures: received.append((k, captures[1])), startstop = None)
+
+    assert stats['captures'] == 2
+    assert stats['timeouts'] == 1
+    assert [k for k, capture in received] == [0, 2]
+    assert all(np.allclose(v, np.arange(1000) * 1.0e-3) for k, (v, t, preamble) in received)
+    assert decoded_on and threading.main_thread() not in decoded_on
+
+def test_save_setup(tmp_path):
+    scope = FakeMSO456()
+    scope._datastorage_path = str(tmp_path)
+
+    assert scope.save_setup('bench') == b':HEADER 1;:HORIZONTAL:RECORDLENGTH 1000'
+    assert (tmp_path / 'bench.setup').read_bytes() == b':HEADER 1;:HORIZONTAL:RECORDLENGTH 1000'
+
+def test_save_setup_failed_query(tmp_path):
+    scope = FakeMSO456()
+    scope._datastorage_path = str(tmp_path)
+    scope.setup = None      # Like scpi.Device on a failed query or when not connected
+
+    assert scope.save_setup('bench') is None
+    assert not (tmp_path / 'bench.setup').exists()
+
+def test_configure_measurements_names_unsupported(capsys):
+    scope = FakeMSO456()
+
+    scope.configure_measurements(1)
+    warning = capsys.readouterr().out
+    for m in (M.V_UPPER, M.V_MIDDLE, M.V_LOWER, M.PERIOD_AREA, M.VARIANCE):
+        assert m.name in warning
+        assert m not in scope._measure_slots[0]
+    assert 'TYPe TIMETOMAX' in scope.sent[0] and 'TYPe TIMETOMIN' in scope.sent[0]
+
+    with pytest.raises(ValueError):
+        scope.configure_measurements(1, M.VARIANCE)
+
+def test_stored_captures_fold(tmp_path, monkeypatch):
+    scope = FakeMSO456(record_length = 1000)
+    scope._datastorage_path = str(tmp_path)
+    for name in ('run0', 'run1'):
+        scope.data(1, startstop = None, filename = name)
+
+    monkeypatch.chdir(tmp_path.parent)
+    avg = Average()
+    assert fold(['run0', 'run1'], avg, directory = scope.datastorage_path) == 2
+    assert np.allclose(avg.mean, np.arange(1000) * 1.0e-3)
@@ -0,0 +1,210 @@
+# Saleae Logic driver against the local stand-in server (instruments.saleae.simulator)
+
+# Standard
+import os
+
+# 3rd party
+import numpy as np
+import pytest
+
+# Local
+from instruments.saleae.logic import Logic, LogicPro16, read_csv, write_csv, read_binary, write_binary, stitch
+from instruments.saleae.products import USB_VID
+from instruments.saleae.simulator import Simulator
+
+@pytest.fixture
+def connect(tmp_path):
+    ''' Factory for a LogicPro16 connected to a fresh simulator, both closed after the test
+    '''
+    opened = []
+
+    def factory(**simulator_args):
+        simulator_args.setdefault('capture_time', 0.0)
+        simulator_args.setdefault('seed', 1)
+        sim = Simulator(port = 0, **simulator_args).start()
+        la = LogicPro16(vid = USB_VID, pid = LogicPro16.USB_PID, ipaddr = sim.address, datastorage_path = str(tmp_path) + os.sep)
+        opened.append((sim, la))
+        la.set_sample_rate((100000000, 0))
+        la.set_capture_seconds(0.01)
+        return sim, la
+
+    yield factory
+
+    for sim, la in opened:
+        la._s.close()
+        sim.stop()
+    Logic.instance = False
+
+def test_binary_and_csv_time_origin(connect):
+    sim, la = connect(transitions = 5000, trigger_time = 0.002)
+    la.capture_start_and_wait_until_finished()
+    la.export_data('c.csv')
+    la.export_data('c.bin', format = 'binary', each_sample = False)
+
+    t_csv, d_csv = la.data('c.csv', plotit = False)
+    t_bin, d_bin = la.data('c.bin', plotit = False)
+    assert np.array_equal(d_csv.words, d_bin.words)
+    assert t_csv[0] == pytest.approx(-0.002)
+    assert np.allclose(t_bin - t_csv, 0.002, rtol = 0, atol = 1e-12)
+
+    assert la.align_binary('c.csv', 'c.bin') == pytest.approx(-0.002)
+    t_bin, d_bin = la.data('c.bin', plotit = False)
+    assert np.allclose(t_bin, t_csv, rtol = 0, atol = 1e-12)
+
+def test_cmd_many_stays_in_step(connect):
+    sim, la = connect()
+    assert la._cmd_many(['GET_PERFORMANCE', 'NOT_A_COMMAND', 'GET_PERFORMANCE'], expect_nak = True) == ['100', None, '100']
+
+    with pytest.raises(la.CommandNAKedError):
+        la._cmd_many(['GET_PERFORMANCE', 'NOT_A_COMMAND', 'GET_PERFORMANCE'])
+
+    # Every reply was drained, so later commands get their own replies
+    assert la.get_active_channels() == (list(range(16)), [])
+
+def test_configure(connect):
+    sim, la = connect()
+    la.configure(digital = [0, 1, 2, 3], sample_rate = (50000000, 0), capture_seconds = 0.02)
+    assert la.get_active_channels() == ([0, 1, 2, 3], [])
+    assert int(la.get_num_samples()) == 1000000
+    assert sim.commands['SET_SAMPLE_RATE'] == 2    # connect() sets one too
+
+    # A rejected setting does not stop the others
+    with pytest.raises(la.ImpossibleSettings, match = 'sample_rate'):
+        la.configure(sample_rate = (123, 0), num_samples = 5000)
+    assert int(la.get_num_samples()) == 5000
+    assert la._sample_rate == (50000000, 0)
+
+def test_csv_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    t = np.cumsum(rng.random(10000)) * 1.0e-6
+    words = rng.integers(0, 1 << 16, len(t))
+    filepath = str(tmp_path / 'w.csv')
+
+    write_csv(filepath, t, words, 16)
+    tt, ww = read_csv(filepath)
+    assert np.array_equal(tt, t)
+    assert np.array_equal(ww, words)
+
+    write_csv(filepath, t, words, 16, headers = False)
+    tt, ww = read_csv(filepath)
+    assert np.array_equal(ww, words)
+
+def test_binary_round_trip(tmp_path):
+    samples = np.array([0, 3, 10, 11, 500])
+    words = np.array([0, 1, 3, 2, 0x8000])
+    filepath = str(tmp_path / 'w.bin')
+
+    write_binary(filepath, samples / 1.0e6, words, 1.0e6, 16)
+    t, ww = read_binary(filepath, 1.0e6)
+    assert np.allclose(t * 1.0e6, samples)
+    assert np.array_equal(ww, words)
+
+def test_stitch():
+    parts = [(np.array([0.0, 1.0, 2.0]), np.array([0, 1, 0])),
+             (np.array([2.0, 2.5, 3.0]), np.array([0, 0, 1])),    # Repeats t = 2.0, then restates 0
+             (np.array([3.0, 4.0]), np.array([1, 0]))]
+    t, words = stitch(parts)
+    assert np.array_equal(t, [0.0, 1.0, 2.0, 3.0, 4.0])
+    assert np.array_equal(words, [0, 1, 0, 1, 0])
+
+def test_connect(connect):
+    sim, la = connect()
+    assert la.simulated
+    assert 'LOGIC_PRO_16_DEVICE' in la.id
+    assert la.get_active_channels() == (list(range(16)), [])
+
+@pytest.mark.parametrize('format, args', [('csv', {}), ('binary', {'each_sample' : False})])
+def test_capture_export_data(connect, format, args):
+    sim, la = connect(transitions = 20000)
+    la.capture_start_and_wait_until_finished()
+    assert la.is_processing_complete()
+
+    filename = 'c.csv' if 'csv' == format else 'c.bin'
+    la.export_data(filename, format = format, **args)
+    t, data = la.data(filename, plotit = False)
+
+    assert len(t) == len(sim._samples)
+    assert np.allclose(t, sim._samples / 1.0e8, rtol = 0, atol = 1e-12)
+    assert np.array_equal(data.words, sim._words)
+    assert len(data) == 16
+
+    # Each row toggles one channel
+    toggled = (data.words[1:] ^ data.words[:-1]).astype(np.uint64)
+    assert np.all((toggled != 0) & ((toggled & (toggled - np.uint64(1))) == 0))
+
+def test_export_each_sample(connect):
+    sim, la = connect(transitions = 100)
+    la.set_num_samples(10000)
+    la.capture_start_and_wait_until_finished()
+    la.export_data('e.bin', format = 'binary', each_sample = True)
+    t, data = la.data('e.bin', plotit = False)
+
+    assert len(t) == 10000
+    rows = np.searchsorted(sim._samples, np.arange(10000), side = 'right') - 1
+    assert np.array_equal(data.words, sim._words[rows])
+
+def test_export_time_span_and_channels(connect):
+    sim, la = connect(transitions = 20000)
+    la.capture_start_and_wait_until_finished()
+    la.export_data('s.csv', digital_channels = [3, 5], time_span = (0.002, 0.004))
+    t, words = read_csv(os.path.join(la.datastorage_path, 's.csv'))
+
+    assert t[0] == pytest.approx(0.002)
+    assert t[-1] <= 0.004
+    assert words.max() <= 3
+    assert np.array_equal(words & 1, ((sim._words[np.searchsorted(sim._samples, np.rint(t * 1.0e8), side = 'right') - 1] >> 3) & 1))
+
+@pytest.mark.parametrize('trigger_time', [0.0, 0.002])
+@pytest.mark.parametrize('format', ['csv', 'binary'])
+def test_export_sharded(connect, format, trigger_time):
+    sim, la = connect(transitions = 20000, trigger_time = trigger_time)
+    la.capture_start_and_wait_until_finished()
+    la.export_data('full.csv')
+    t, data = la.data('full.csv', plotit = False)
+
+    ts, shards = la.export_sharded('sharded', shards = 3, workers = 2, format = format)
+    assert ts[0] == pytest.approx(-trigger_time)
+    assert len(ts) == len(t)
+    assert np.allclose(ts, t, rtol = 0, atol = 1e-12)
+    assert np.array_equal(shards.words, data.words)
+    assert not any('shard' in f for f in os.listdir(la.datastorage_path))
+
+@pytest.mark.parametrize('format', ['csv', 'binary'])
+def test_capture_loop(connect, format):
+    sim, la = connect(transitions = 2000, capture_time = 0.05, export_delay = 0.02)
+    received = []
+
+    def sink(k, t, data):
+        received.append((k, len(t), data.words.copy()))
+
+    stats = la.capture_loop(3, sink, format = format)
+    assert stats['captures'] == 3
+    assert stats['timeouts'] == 0
+    assert stats['max_dead_sec'] >= 0.0
+    assert [k for k, n, words in received] == [0, 1, 2]
+    assert all(n > 1000 for k, n, words in received)
+    assert np.array_equal(received[-1][2], sim._words)
+    assert not any(f.startswith('capture_') for f in os.listdir(la.datastorage_path))
+
+def test_capture_loop_summary_when_verbose(connect, capsys):
+    sim, la = connect(transitions = 100)
+
+    la.capture_loop(1, lambda k, t, data: None)
+    assert 'captures/sec' not in capsys.readouterr().out
+
+    la.verbose = True
+    la.capture_loop(1, lambda k, t, data: None)
+    assert 'captures/sec' in capsys.readouterr().out
+
+@pytest.mark.parametrize('format', ['csv', 'binary'])
+def test_simulate_data(connect, format):
+    sim, la = connect()
+    t = np.arange(100) * 1.0e-6
+    data = [(np.arange(100) >> ch) & 1 for ch in range(16)]
+
+    la.simulate_data('fixture', t, data, format = format)
+    filename = 'fixture_simulated' + ('.csv' if 'csv' == format else '.bin')
+    tt, dd = la.data(filename, plotit = False)
+
+    assert np.allclose(tt, t, rtol = 0, atol = 1e-12)
+    assert all(np.array_equal(dd[ch], data[ch].astype(bool)) for ch in range(16))